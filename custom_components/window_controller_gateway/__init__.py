@@ -4,6 +4,7 @@ import os
 import re
 import asyncio
 import voluptuous as vol
+from dataclasses import dataclass
 from datetime import timedelta
 from typing import Any, Dict, Optional, Tuple
 
@@ -29,6 +30,13 @@ from .const import (
     POSITION_MIN,
     POSITION_MAX
 )
+from .utils import (
+    index_device_sn,
+    unindex_device_sn,
+    clear_device_sn_index,
+    register_gateway_sn,
+    unregister_gateway_sn,
+)
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -37,6 +45,13 @@ PLATFORMS = [Platform.COVER, Platform.BINARY_SENSOR, Platform.BUTTON, Platform.S
 # 发现平台名称
 DISCOVERY_PLATFORM = "window_controller_gateway"
 
+
+@dataclass(slots=True)
+class EntryRuntimeData:
+    """配置条目运行时数据，保存在entry.runtime_data上供平台直接访问"""
+    device_manager: Any
+    mqtt_handler: Any
+
 async def _cleanup_duplicate_entities(hass: HomeAssistant, entry: ConfigEntry):
     """清理重复实体
     
@@ -624,6 +639,8 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
         # 创建设备管理器
         _LOGGER.debug("正在创建设备管理器...")
         device_manager = WindowControllerDeviceManager(hass, entry)
+        # 立即启动出站命令合并任务，不依赖后台初始化完成
+        device_manager.command_batcher.start()
 
         # 快速注册网关设备（立即返回，给用户即时反馈）
         _LOGGER.debug("正在注册网关设备实体...")
@@ -667,6 +684,21 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
             "mqtt_handler": mqtt_handler,
             "unsub_listeners": unsub_listeners
         }
+        entry.runtime_data = EntryRuntimeData(
+            device_manager=device_manager,
+            mqtt_handler=mqtt_handler
+        )
+        register_gateway_sn(hass, gateway_sn)
+
+        # 维护设备SN反向索引，供服务调用快速定位网关
+        async def index_added_device(device_sn: str, device_name: str, device_type: str):
+            index_device_sn(hass, device_sn, entry.entry_id)
+
+        async def unindex_removed_device(device_sn: str, device_name: str, device_type: str):
+            unindex_device_sn(hass, device_sn, entry.entry_id)
+
+        device_manager.set_device_added_callback(index_added_device)
+        device_manager.set_device_removed_callback(unindex_removed_device)
 
         # 设置平台（快速返回，不等待实体创建完成）
         _LOGGER.debug("正在设置前端平台组件...")
@@ -824,6 +856,8 @@ async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     # 6. 最后移除数据
     if unload_successful:
         hass.data[DOMAIN].pop(entry_id, None)
+        clear_device_sn_index(hass, entry_id)
+        unregister_gateway_sn(hass, data.get("gateway_sn"))
         _LOGGER.info("配置条目 %s 卸载成功", entry_id)
     else:
         _LOGGER.warning("配置条目 %s 卸载完成，但部分清理操作遇到问题", entry_id)
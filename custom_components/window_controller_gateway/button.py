@@ -29,21 +29,6 @@ from .utils import get_device_gateway_mapping
 _LOGGER = logging.getLogger(__name__)
 
 
-from .utils import get_entity_registry
-
-
-def _get_entity_registry(hass):
-    """获取实体注册表（带缓存）
-    
-    Args:
-        hass: Home Assistant实例
-    
-    Returns:
-        EntityRegistry: 实体注册表
-    """
-    return get_entity_registry(hass)
-
-
 def _check_entity_exists(hass, platform, domain, unique_id):
     """检查实体是否已存在
     
@@ -56,7 +41,7 @@ def _check_entity_exists(hass, platform, domain, unique_id):
     Returns:
         bool: 实体是否存在
     """
-    entity_registry = _get_entity_registry(hass)
+    entity_registry = async_get_entity_registry(hass)
     entity_id = entity_registry.async_get_entity_id(platform, domain, unique_id)
     return entity_id is not None
 
@@ -79,7 +64,7 @@ def _create_device_buttons(hass, device_manager, mqtt_handler, gateway_sn, devic
     entities_to_add = []
     
     # 批量检查实体是否存在（优化版：一次性获取所有相关实体）
-    entity_registry = _get_entity_registry(hass)
+    entity_registry = async_get_entity_registry(hass)
     existing_entities = {}
     
     # 生成所有需要检查的唯一ID
@@ -371,38 +356,35 @@ async def async_setup_entry(
     # entities.append(replace_button)
     
     # 为每个开窗器设备添加删除按钮（显示在网关控制栏）
-    devices = device_manager.get_all_devices()
-    
-    for device in devices:
-        if device["type"] == DEVICE_TYPE_WINDOW_OPENER:
-            device_sn = device["sn"]
-            device_name = device["name"]
-            
-            # 生成删除按钮的唯一ID
-            remove_button_unique_id = f"{gateway_sn}_remove_{device_sn}"
-            
-            # 检查实体是否已经存在
-            if not _check_entity_exists(hass, "button", DOMAIN, remove_button_unique_id):
-                # 添加删除按钮（显示在网关控制栏）
-                remove_button = GatewayDeviceRemoveButton(
-                    hass,
-                    device_manager,
-                    mqtt_handler,
-                    gateway_sn,
-                    gateway_name,
-                    device_sn,
-                    device_name,
-                    str(entry.entry_id)
-                )
-                entities.append(remove_button)
-                created_remove_buttons[device_sn] = remove_button
-                _LOGGER.debug("为设备 %s 添加删除按钮", device_name)
-            else:
-                _LOGGER.debug("设备 %s 的删除按钮已存在，跳过创建", device_name)
-            
-            # 为设备创建所有按钮
-            device_buttons = _create_device_buttons(hass, device_manager, mqtt_handler, gateway_sn, device_sn, device_name, str(entry.entry_id))
-            entities.extend(device_buttons)
+    # 通过设备管理器的类型索引直接遍历开窗器设备
+    for device_sn, device in device_manager.iter_devices_by_type(DEVICE_TYPE_WINDOW_OPENER):
+        device_name = device["name"]
+        
+        # 生成删除按钮的唯一ID
+        remove_button_unique_id = f"{gateway_sn}_remove_{device_sn}"
+        
+        # 检查实体是否已经存在
+        if not _check_entity_exists(hass, "button", DOMAIN, remove_button_unique_id):
+            # 添加删除按钮（显示在网关控制栏）
+            remove_button = GatewayDeviceRemoveButton(
+                hass,
+                device_manager,
+                mqtt_handler,
+                gateway_sn,
+                gateway_name,
+                device_sn,
+                device_name,
+                str(entry.entry_id)
+            )
+            entities.append(remove_button)
+            created_remove_buttons[device_sn] = remove_button
+            _LOGGER.debug("为设备 %s 添加删除按钮", device_name)
+        else:
+            _LOGGER.debug("设备 %s 的删除按钮已存在，跳过创建", device_name)
+        
+        # 为设备创建所有按钮
+        device_buttons = _create_device_buttons(hass, device_manager, mqtt_handler, gateway_sn, device_sn, device_name, str(entry.entry_id))
+        entities.extend(device_buttons)
     
     # 定义设备添加回调函数
     async def on_device_added(device_sn: str, device_name: str, device_type: str):
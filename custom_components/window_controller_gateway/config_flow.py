@@ -1,6 +1,5 @@
 """Window Controller Gateway Configuration Flow"""
 import voluptuous as vol
-import re
 import logging
 import asyncio
 from typing import Any, Dict, Optional
@@ -24,9 +23,7 @@ _LOGGER = logging.getLogger(__name__)
 
 def validate_gateway_sn(sn: str) -> bool:
     """Validate gateway serial number format"""
-    if not sn or len(sn) < 10:
-        return False
-    return bool(re.match(r'^[a-zA-Z0-9]+$', sn))
+    return bool(sn) and len(sn) >= 10 and sn.isascii() and sn.isalnum()
 
 class ConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
     """Configuration flow handler class"""
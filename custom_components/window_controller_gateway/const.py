@@ -78,6 +78,9 @@ class DeviceConstants:
     # 设备到网关映射表常量
     DEVICE_TO_GATEWAY_MAPPING = "device_to_gateway_mapping"
     
+    # 设备网关映射变更信号（按设备SN区分）
+    SIGNAL_GATEWAY_REASSIGN = "window_controller_gateway_gateway_reassign_{device_sn}"
+    
     # 全局手动删除设备列表常量
     GLOBAL_MANUALLY_REMOVED_DEVICES = "global_manually_removed_devices"
 
@@ -94,6 +97,7 @@ class MqttConstants:
     MQTT_MAX_JITTER = 1.5  # 最大抖动系数
     MQTT_RETRY_DELAY_MAX = 60  # 最大重试延迟（秒）
     MQTT_BATCH_SIZE = 20  # 批处理大小
+    MQTT_MAX_INFLIGHT = 128  # 同时在途的命令发布上限
     
     # 协议相关常量
     PROTOCOL_HEAD = "$SH"  # 协议头
@@ -186,6 +190,9 @@ class TimeConstants:
     INITIAL_RETRY_DELAY = 5  # 初始重试延迟
     MIGRATION_DELAY = 1  # 迁移延迟
     RESTART_DELAY = 5  # 重启延迟
+    COMMAND_BATCH_INTERVAL = 0.05  # 出站命令合并窗口
+    COMMAND_MIN_INTERVAL = 0.05  # 同一设备两次发送之间的最小间隔
+    STATUS_COALESCE_INTERVAL = 0.05  # 入站设备上报合并窗口
     GATEWAY_PAIRING_TIMEOUT = 60  # 网关配对超时时间（秒）
 
 
@@ -309,6 +316,9 @@ GATEWAY_CHECK_INTERVAL = TimeConstants.GATEWAY_CHECK_INTERVAL
 INITIAL_RETRY_DELAY = TimeConstants.INITIAL_RETRY_DELAY
 MIGRATION_DELAY = TimeConstants.MIGRATION_DELAY
 RESTART_DELAY = TimeConstants.RESTART_DELAY
+COMMAND_BATCH_INTERVAL = TimeConstants.COMMAND_BATCH_INTERVAL
+COMMAND_MIN_INTERVAL = TimeConstants.COMMAND_MIN_INTERVAL
+STATUS_COALESCE_INTERVAL = TimeConstants.STATUS_COALESCE_INTERVAL
 GATEWAY_PAIRING_TIMEOUT = TimeConstants.GATEWAY_PAIRING_TIMEOUT
 
 # MQTT常量
@@ -318,6 +328,7 @@ MQTT_MIN_JITTER = MqttConstants.MQTT_MIN_JITTER
 MQTT_MAX_JITTER = MqttConstants.MQTT_MAX_JITTER
 MQTT_RETRY_DELAY_MAX = MqttConstants.MQTT_RETRY_DELAY_MAX
 MQTT_BATCH_SIZE = MqttConstants.MQTT_BATCH_SIZE
+MQTT_MAX_INFLIGHT = MqttConstants.MQTT_MAX_INFLIGHT
 
 # 协议相关常量
 PROTOCOL_HEAD = MqttConstants.PROTOCOL_HEAD
@@ -347,6 +358,7 @@ ENTITY_ONLINE_SENSOR_SUFFIX = EntityConstants.ENTITY_ONLINE_SENSOR_SUFFIX
 
 # 设备到网关映射表常量
 DEVICE_TO_GATEWAY_MAPPING = DeviceConstants.DEVICE_TO_GATEWAY_MAPPING
+SIGNAL_GATEWAY_REASSIGN = DeviceConstants.SIGNAL_GATEWAY_REASSIGN
 
 # 全局手动删除设备列表常量
 GLOBAL_MANUALLY_REMOVED_DEVICES = DeviceConstants.GLOBAL_MANUALLY_REMOVED_DEVICES
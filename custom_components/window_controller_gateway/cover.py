@@ -1,5 +1,8 @@
 """开窗器网关组件"""
 import logging
+import sys
+from functools import cached_property
+from types import MappingProxyType
 from typing import Optional, Dict, Any
 
 from homeassistant.components.cover import (
@@ -9,10 +12,12 @@ from homeassistant.components.cover import (
     ATTR_POSITION,
     ATTR_CURRENT_POSITION
 )
-from homeassistant.core import HomeAssistant
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.exceptions import HomeAssistantError
 from homeassistant.config_entries import ConfigEntry
 from homeassistant.helpers.entity import DeviceInfo
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
+from homeassistant.helpers.dispatcher import async_dispatcher_connect
 
 from .const import (
     DOMAIN,
@@ -26,12 +31,22 @@ from .const import (
     COMMAND_STOP,
     COMMAND_SET_POSITION,
     COMMAND_A,
-    DEVICE_TYPE_WINDOW_OPENER
+    DEVICE_TYPE_WINDOW_OPENER,
+    SIGNAL_GATEWAY_REASSIGN
 )
 from .utils import get_device_gateway_mapping
 
 _LOGGER = logging.getLogger(__name__)
 
+# 设备类型到设备类别的映射（只读）
+_DEVICE_CLASS_MAP = MappingProxyType({
+    "window_controller": CoverDeviceClass.SHUTTER,
+    "curtain": CoverDeviceClass.SHUTTER,
+    "shutter": CoverDeviceClass.SHUTTER,
+    "blind": CoverDeviceClass.BLIND,
+    "awning": CoverDeviceClass.AWNING
+})
+
 async def async_setup_entry(
     hass: HomeAssistant,
     entry: ConfigEntry,
@@ -40,16 +55,14 @@ async def async_setup_entry(
     """设置开窗器实体"""
     gateway_sn = entry.data[CONF_GATEWAY_SN]
     
-    # 从设备管理器获取设备
-    domain_data = hass.data[DOMAIN]
-    entry_data = domain_data.get(entry.entry_id)
-    
-    if not entry_data:
+    # 直接从配置条目的运行时数据获取设备管理器和MQTT处理器
+    runtime = getattr(entry, "runtime_data", None)
+    if runtime is None:
         _LOGGER.error("配置条目数据未找到: %s", entry.entry_id)
         return
         
-    device_manager = entry_data.get("device_manager")
-    mqtt_handler = entry_data.get("mqtt_handler")
+    device_manager = runtime.device_manager
+    mqtt_handler = runtime.mqtt_handler
     
     if not device_manager or not mqtt_handler:
         _LOGGER.error("设备管理器或MQTT处理器未找到")
@@ -63,6 +76,16 @@ async def async_setup_entry(
 class WindowControllerCover(CoverEntity):
     """开窗器实体"""
     
+    # 状态由设备管理器推送，无需轮询
+    _attr_should_poll = False
+    # 支持的功能对所有实例相同，定义在类上
+    _attr_supported_features = (
+        CoverEntityFeature.OPEN |
+        CoverEntityFeature.CLOSE |
+        CoverEntityFeature.STOP
+    )
+    _attr_icon = "mdi:window-open"
+    
     def __init__(
         self,
         hass: HomeAssistant,
@@ -81,21 +104,20 @@ class WindowControllerCover(CoverEntity):
         self.device_sn = device_sn
         self._attr_name = device_name
         self.device_type = device_type
-        self._attr_unique_id = f"{gateway_sn}_{device_sn}"
-        self._attr_device_class = self._get_device_class(device_type)
-        # 添加图标
-        self._attr_icon = "mdi:window-open"
-        
-        # 设置支持的功能
-        self._attr_supported_features = (
-            CoverEntityFeature.OPEN |
-            CoverEntityFeature.CLOSE |
-            CoverEntityFeature.STOP
-        )
+        self._model = device_type.capitalize()
+        # 复用设备管理器预先构建的设备标识
+        device = device_manager.get_device(device_sn)
+        self._identifiers = (device or {}).get("identifiers") or frozenset({(DOMAIN, device_sn)})
+        self._attr_unique_id = sys.intern(f"{gateway_sn}_{device_sn}")
+        self._attr_device_class = _DEVICE_CLASS_MAP.get(device_type, CoverDeviceClass.SHUTTER)
         
         # 初始化状态
         self._attr_is_closed = None
         self._attr_current_cover_position = None
+        self._attr_is_opening = False
+        self._attr_is_closing = False
+        # 最近一次应用的设备数据修订号
+        self._last_rev = None
         
         # 更新初始状态
         self._update_state_from_device()
@@ -124,31 +146,37 @@ class WindowControllerCover(CoverEntity):
         """覆盖默认行为，始终允许停止操作"""
         return True
         
-    def _get_device_class(self, device_type: str) -> CoverDeviceClass:
-        """根据设备类型获取设备类别"""
-        device_class_map = {
-            "window_controller": CoverDeviceClass.SHUTTER,
-            "curtain": CoverDeviceClass.SHUTTER,
-            "shutter": CoverDeviceClass.SHUTTER,
-            "blind": CoverDeviceClass.BLIND,
-            "awning": CoverDeviceClass.AWNING
-        }
-        return device_class_map.get(device_type, CoverDeviceClass.SHUTTER)
+    def _update_state_from_device(self, device: Optional[Dict[str, Any]] = None) -> bool:
+        """从设备管理器更新状态
         
-    def _update_state_from_device(self):
-        """从设备管理器更新状态"""
-        device = self.device_manager.get_device(self.device_sn)
-        if device:
-            attributes = device.get("attributes", {})
-            # 优先使用r_travel作为位置
-            position = attributes.get("r_travel")
-            # 如果没有r_travel，使用传统的position
-            if position is None:
-                position = attributes.get(CONST_ATTR_POSITION)
-            
-            if position is not None:
-                self._attr_current_cover_position = position
-                # 不再设置_attr_is_closed，让is_closed属性动态计算
+        Args:
+            device: 设备记录，未提供时从设备管理器获取
+        
+        Returns:
+            bool: 设备数据是否有新的修订
+        """
+        if device is None:
+            device = self.device_manager.get_device(self.device_sn)
+        # 设备数据修订号未变化时直接跳过
+        if not device or device.get("_rev", 0) == self._last_rev:
+            return False
+        self._last_rev = device.get("_rev", 0)
+        # 设备已上报新状态，结束命令发送后设置的乐观运动状态
+        self._attr_is_opening = False
+        self._attr_is_closing = False
+        attributes = device.get("attributes", {})
+        # 优先使用r_travel作为位置
+        position = attributes.get("r_travel")
+        # 如果没有r_travel，使用传统的position
+        if position is None:
+            position = attributes.get(CONST_ATTR_POSITION)
+        
+        if position is not None:
+            self._attr_current_cover_position = position
+            # 不再设置_attr_is_closed，让is_closed属性动态计算
+        
+        # 修订号变化即表示状态或属性（含额外状态属性）发生了变化
+        return True
     
     @property
     def extra_state_attributes(self):
@@ -178,23 +206,65 @@ class WindowControllerCover(CoverEntity):
             return self._attr_current_cover_position == 0
         return None  # 让HA使用默认行为
         
-    @property
+    @cached_property
     def device_info(self) -> DeviceInfo:
-        """返回设备信息"""
+        """返回设备信息（缓存，网关映射变更时失效）"""
         # 动态获取设备当前关联的网关
         current_gateway_sn = get_device_gateway_mapping(self.hass, self.device_sn) or self.gateway_sn
         
         return DeviceInfo(
-            identifiers={(DOMAIN, self.device_sn)},
+            identifiers=self._identifiers,
             name=self._attr_name,
             manufacturer=MANUFACTURER,
-            model=self.device_type.capitalize(),
+            model=self._model,
             serial_number=self.device_sn,
             via_device=(DOMAIN, current_gateway_sn)
         )
+    
+    async def async_added_to_hass(self) -> None:
+        """实体添加到Home Assistant时订阅网关映射变更信号和设备状态推送"""
+        await super().async_added_to_hass()
+        self.async_on_remove(
+            async_dispatcher_connect(
+                self.hass,
+                SIGNAL_GATEWAY_REASSIGN.format(device_sn=self.device_sn),
+                self._on_gateway_reassigned
+            )
+        )
+        self.async_on_remove(
+            self.device_manager.register_device_update_callback(
+                self.device_sn, self._on_device_update
+            )
+        )
+    
+    @callback
+    def _on_device_update(self, device: Dict[str, Any]) -> None:
+        """设备状态更新推送"""
+        if self._update_state_from_device(device):
+            self.async_write_ha_state()
+    
+    @callback
+    def _on_gateway_reassigned(self) -> None:
+        """网关映射变更时清除缓存的设备信息（设备注册表由映射写入方更新）"""
+        self.__dict__.pop("device_info", None)
+        
+    def _get_current_mqtt_handler(self):
+        """获取设备当前关联网关的MQTT处理器，处理网关切换逻辑"""
+        # 动态获取设备当前关联的网关
+        current_gateway_sn = get_device_gateway_mapping(self.hass, self.device_sn) or self.gateway_sn
+        if current_gateway_sn == self.gateway_sn:
+            return self.mqtt_handler
         
+        # 设备关联的网关与当前网关不同，查找该网关的mqtt_handler
+        _LOGGER.debug("设备 %s 当前关联到网关: %s", self.device_sn, current_gateway_sn)
+        for data in self.hass.data[DOMAIN].values():
+            if isinstance(data, dict) and data.get("gateway_sn") == current_gateway_sn and "mqtt_handler" in data:
+                return data["mqtt_handler"]
+        _LOGGER.error("未找到设备 %s 关联的网关 %s 的MQTT处理器", self.device_sn, current_gateway_sn)
+        return None
+    
     async def _send_command_to_device(self, command: str, params: Optional[Dict[str, Any]] = None) -> bool:
-        """发送命令到设备，处理网关切换逻辑
+        """发送命令到设备，只有发送成功后才写入状态
         
         Args:
             command: 命令类型
@@ -203,61 +273,79 @@ class WindowControllerCover(CoverEntity):
         Returns:
             bool: 命令发送是否成功
         """
+        mqtt_handler = self._get_current_mqtt_handler()
+        if mqtt_handler is None:
+            return False
+        
+        device_sn = self.device_sn
         try:
-            # 动态获取设备当前关联的网关
-            from .const import DEVICE_TO_GATEWAY_MAPPING
-            current_gateway_sn = self.gateway_sn
-            if DEVICE_TO_GATEWAY_MAPPING in self.hass.data[DOMAIN]:
-                device_to_gateway_mapping = self.hass.data[DOMAIN][DEVICE_TO_GATEWAY_MAPPING]
-                if self.device_sn in device_to_gateway_mapping:
-                    current_gateway_sn = device_to_gateway_mapping[self.device_sn]
-                    _LOGGER.debug("设备 %s 当前关联到网关: %s", self.device_sn, current_gateway_sn)
-            
-            # 如果设备关联的网关与当前网关不同，需要找到正确的mqtt_handler
-            if current_gateway_sn != self.gateway_sn:
-                # 查找与设备关联的网关的mqtt_handler
-                for entry_id, data in self.hass.data[DOMAIN].items():
-                    if isinstance(data, dict) and data.get("gateway_sn") == current_gateway_sn:
-                        if "mqtt_handler" in data:
-                            mqtt_handler = data["mqtt_handler"]
-                            await mqtt_handler.send_command(self.device_sn, command, params)
-                            self.async_write_ha_state()
-                            _LOGGER.info("发送%s命令到设备 %s（通过网关 %s）", command, self.device_sn, current_gateway_sn)
-                            return True
-                _LOGGER.error("未找到设备 %s 关联的网关 %s 的MQTT处理器", self.device_sn, current_gateway_sn)
-            else:
-                # 使用当前mqtt_handler发送命令
-                await self.mqtt_handler.send_command(self.device_sn, command, params)
-                self.async_write_ha_state()
-                _LOGGER.info("发送%s命令到设备: %s", command, self.device_sn)
-                return True
+            async with mqtt_handler.inflight_semaphore:
+                sent = await mqtt_handler.send_command(device_sn, command, params)
         except Exception as e:
             _LOGGER.error("发送%s命令失败: %s", command, e)
-        return False
+            return False
+        # send_command 在发布失败时返回False而不是抛出异常
+        if not sent:
+            return False
+        
+        if _LOGGER.isEnabledFor(logging.DEBUG):
+            _LOGGER.debug("发送%s命令到设备 %s（通过网关 %s）", command, device_sn, mqtt_handler.gateway_sn)
+        # 发送成功后立即反馈乐观状态，设备上报后以实际状态为准
+        if self._apply_optimistic_state(command, params):
+            self.async_write_ha_state()
+        return True
+    
+    def _apply_optimistic_state(self, command: str, params: Optional[Dict[str, Any]]) -> bool:
+        """根据已成功发送的命令设置乐观状态
+        
+        Returns:
+            bool: 是否修改了状态
+        """
+        if command == COMMAND_OPEN:
+            self._attr_is_opening, self._attr_is_closing = True, False
+        elif command == COMMAND_CLOSE:
+            self._attr_is_opening, self._attr_is_closing = False, True
+        elif command == COMMAND_STOP:
+            self._attr_is_opening, self._attr_is_closing = False, False
+        elif command == COMMAND_SET_POSITION and params and params.get("position") is not None:
+            position = params["position"]
+            current = self._attr_current_cover_position
+            self._attr_is_opening = current is not None and position > current
+            self._attr_is_closing = current is not None and position < current
+            self._attr_current_cover_position = position
+        else:
+            return False
+        return True
+    
+    async def _submit_command(self, command: str, params: Optional[Dict[str, Any]] = None):
+        """将命令提交给设备管理器的命令合并器，等待合并窗口结束后的发送结果
+        
+        Raises:
+            HomeAssistantError: 命令发送失败
+        """
+        sent = await self.device_manager.command_batcher.submit(
+            self.device_sn, command, params, self._send_command_to_device
+        )
+        if not sent:
+            raise HomeAssistantError(f"发送{command}命令到设备 {self.device_sn} 失败")
     
     async def async_open_cover(self, **kwargs):
         """打开开窗器"""
-        await self._send_command_to_device(COMMAND_OPEN)
+        await self._submit_command(COMMAND_OPEN)
     
     async def async_close_cover(self, **kwargs):
         """关闭开窗器"""
-        await self._send_command_to_device(COMMAND_CLOSE)
+        await self._submit_command(COMMAND_CLOSE)
     
     async def async_stop_cover(self, **kwargs):
         """停止开窗器"""
-        await self._send_command_to_device(COMMAND_STOP)
+        await self._submit_command(COMMAND_STOP)
     
     async def async_set_cover_position(self, **kwargs):
         """设置开窗器位置"""
         position = kwargs.get(ATTR_POSITION)
         if position is not None:
-            await self._send_command_to_device(
+            await self._submit_command(
                 COMMAND_SET_POSITION,
                 {"position": position}
             )
-    
-
-            
-    async def async_update(self):
-        """更新实体状态"""
-        self._update_state_from_device()
\ No newline at end of file
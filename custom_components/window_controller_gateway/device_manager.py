@@ -1,8 +1,10 @@
 """设备管理器 - 修正版"""
 import logging
 import asyncio
+import sys
 import time
-from typing import Dict, Any, List, Optional, Callable
+from collections import defaultdict
+from typing import Dict, Any, Iterator, List, Optional, Callable, Tuple, ValuesView
 from homeassistant.core import HomeAssistant
 from homeassistant.config_entries import ConfigEntry
 from homeassistant.helpers.device_registry import async_get
@@ -297,11 +299,144 @@ from .const import (
     DEVICE_REGISTRATION_DELAY,
     GATEWAY_READY_DELAY,
     DEVICE_SETUP_DELAY,
-    MIGRATION_DELAY
+    MIGRATION_DELAY,
+    COMMAND_BATCH_INTERVAL,
+    COMMAND_MIN_INTERVAL,
+    COMMAND_OPEN,
+    COMMAND_CLOSE,
+    COMMAND_STOP
 )
+from .utils import set_device_gateway_mapping
 
 _LOGGER = logging.getLogger(__name__)
 
+
+class CommandBatcher:
+    """出站命令合并与按设备限速器
+
+    每个设备的第一条命令在短暂的合并窗口后发出，窗口内按(device_sn, command)去重，只保留最后一次参数；
+    同一设备的开/关/停属于互斥的动作命令，只保留最后一条。
+    一批命令发出后该设备进入最小间隔冷却期，期间提交的命令在冷却结束时以最新参数补发，
+    因此拖动滑块等高频操作对单个设备的发送频率有上限，且最终一定会发出最后的值。
+    同一设备任一时刻只有一批命令在发送，不同设备之间互不影响。
+    submit返回的future在命令实际发送后得到发送结果，被合并掉的命令与取代它的命令共享结果
+    """
+
+    # 互斥的动作命令，合并窗口内同一设备只发送最后一条
+    _MOTION_COMMANDS = frozenset((COMMAND_OPEN, COMMAND_CLOSE, COMMAND_STOP))
+
+    def __init__(self, interval: float = COMMAND_BATCH_INTERVAL, min_interval: float = COMMAND_MIN_INTERVAL):
+        """初始化命令合并器
+
+        Args:
+            interval: 合并窗口（秒）
+            min_interval: 同一设备一批命令发送完成后到下一批命令发送前的最小间隔（秒）
+        """
+        self._interval = interval
+        self._min_interval = min_interval
+        # device_sn -> {(device_sn, 命令分类): (command, params, sender, futures)}
+        self._pending: Dict[str, Dict[tuple, tuple]] = {}
+        # 处于合并窗口或冷却期的设备的定时器，只在设备活跃期间存在
+        self._timers: Dict[str, asyncio.TimerHandle] = {}
+        # 正在发送命令的设备
+        self._sending: Dict[str, asyncio.Task] = {}
+        self._running = False
+
+    def start(self):
+        """开始调度命令发送，启动前已提交的命令随即进入合并窗口"""
+        if self._running:
+            return
+        self._running = True
+        for device_sn in list(self._pending):
+            self._schedule(device_sn)
+
+    async def stop(self):
+        """停止调度，等待在途发送完成，并立即发出尚未发送的命令"""
+        self._running = False
+        for timer in self._timers.values():
+            timer.cancel()
+        self._timers.clear()
+        if self._sending:
+            await asyncio.gather(*self._sending.values(), return_exceptions=True)
+        pending, self._pending = self._pending, {}
+        await asyncio.gather(
+            *(self._send_device_commands(device_sn, list(entries.values())) for device_sn, entries in pending.items())
+        )
+
+    def submit(
+        self, device_sn: str, command: str, params: Optional[Dict[str, Any]], sender: Callable
+    ) -> asyncio.Future:
+        """提交命令，等待合并窗口或冷却期结束后发送
+
+        Args:
+            device_sn: 设备序列号
+            command: 命令类型
+            params: 命令参数
+            sender: 实际发送命令的协程函数，调用方式为 sender(command, params)，返回是否发送成功
+
+        Returns:
+            asyncio.Future: 命令发送后得到sender的返回值；sender抛出异常时future设置该异常
+        """
+        future = asyncio.get_running_loop().create_future()
+        pending = self._pending.setdefault(device_sn, {})
+        key = (device_sn, "motion" if command in self._MOTION_COMMANDS else command)
+        # 先移除旧条目再插入，保证发送顺序与最后一次提交的顺序一致；
+        # 被取代的命令的等待者改为等待新命令的发送结果
+        old = pending.pop(key, None)
+        futures = old[3] if old is not None else []
+        futures.append(future)
+        pending[key] = (command, params, sender, futures)
+        self._schedule(device_sn)
+        return future
+
+    def _schedule(self, device_sn: str):
+        """设备空闲时开启合并窗口；处于窗口、冷却期或发送中时由现有定时器/发送任务负责"""
+        if not self._running or device_sn in self._timers or device_sn in self._sending:
+            return
+        self._timers[device_sn] = asyncio.get_running_loop().call_later(
+            self._interval, self._fire, device_sn
+        )
+
+    def _fire(self, device_sn: str):
+        """合并窗口或冷却期结束：有待发命令时发出，否则设备回到空闲"""
+        self._timers.pop(device_sn, None)
+        entries = self._pending.pop(device_sn, None)
+        if not entries:
+            return
+        self._sending[device_sn] = asyncio.get_running_loop().create_task(
+            self._send_device_commands(device_sn, list(entries.values()))
+        )
+
+    async def _send_device_commands(self, device_sn: str, entries: list):
+        """按顺序发送单个设备的一批命令，并把结果交给等待者，完成后进入冷却期"""
+        try:
+            for command, params, sender, futures in entries:
+                try:
+                    result = await sender(command, params)
+                except Exception as e:
+                    _LOGGER.error("发送%s命令到设备 %s 失败: %s", command, device_sn, e)
+                    for future in futures:
+                        if not future.done():
+                            future.set_exception(e)
+                    continue
+                for future in futures:
+                    # 等待者可能已被取消
+                    if not future.done():
+                        future.set_result(result)
+        finally:
+            # 发送被取消时本批剩余命令不会再发出，取消其等待者，避免调用方永远等待
+            for _command, _params, _sender, futures in entries:
+                for future in futures:
+                    if not future.done():
+                        future.cancel()
+            self._sending.pop(device_sn, None)
+            if self._running:
+                # 冷却期结束时补发期间提交的最新命令
+                self._timers[device_sn] = asyncio.get_running_loop().call_later(
+                    self._min_interval, self._fire, device_sn
+                )
+
+
 class WindowControllerDeviceManager:
     """设备管理器类"""
     
@@ -312,22 +447,29 @@ class WindowControllerDeviceManager:
         "binary_sensor": DOMAIN
     }
     
+    # 批量添加设备时每批并发添加的设备数
+    _BULK_ADD_BATCH_SIZE = 10
+    
     def __init__(self, hass: HomeAssistant, entry: ConfigEntry):
         """初始化设备管理器"""
         self.hass = hass
         self.entry = entry
-        self.gateway_sn = entry.data[CONF_GATEWAY_SN]
+        self.gateway_sn = sys.intern(entry.data[CONF_GATEWAY_SN])
         self.gateway_name = entry.data.get(CONF_GATEWAY_NAME, f"慧尖网关 {self.gateway_sn[-4:]}")
-        self.devices = {}
+        self.devices: Dict[str, Dict[str, Any]] = {}
+        # 按设备类型建立的二级索引：device_type -> {device_sn: None}，
+        # 用dict作为有序集合，迭代顺序与设备加入顺序一致
+        self._by_type: Dict[str, Dict[str, None]] = defaultdict(dict)
         self.gateway_device_id = None
         self._device_added_callbacks = []
         self._device_removed_callbacks = []
-        self._device_update_callbacks = {}
+        self._device_update_callbacks: Dict[str, List[Callable[[Dict[str, Any]], None]]] = {}
         self._device_registry_cache = None
         self._entity_registry_cache = None
         self._is_migrating = False
         self._migration_lock = asyncio.Lock()
         self._status_query_semaphore = asyncio.Semaphore(3)  # 同时最多3个状态查询
+        self.command_batcher = CommandBatcher()
         self._manually_removed_devices = self._load_manually_removed_devices()
     
     def _load_manually_removed_devices(self) -> set:
@@ -365,6 +507,20 @@ class WindowControllerDeviceManager:
             bool: 如果设备被手动删除过返回True，否则返回False
         """
         return device_sn in self._manually_removed_devices
+    
+    def _set_device(self, device_sn: str, device_info: Dict[str, Any]) -> None:
+        """写入设备记录并同步类型索引"""
+        old_device = self.devices.get(device_sn)
+        # 类型不变时保留设备在索引中的原有位置
+        if old_device is not None and old_device.get("type") != device_info.get("type"):
+            self._by_type[old_device.get("type")].pop(device_sn, None)
+        # 预先构建设备注册表标识，实体构建DeviceInfo时直接复用
+        if old_device is not None and "identifiers" in old_device:
+            device_info.setdefault("identifiers", old_device["identifiers"])
+        else:
+            device_info.setdefault("identifiers", frozenset({(DOMAIN, device_sn)}))
+        self.devices[device_sn] = device_info
+        self._by_type[device_info.get("type")].setdefault(device_sn, None)
         
     async def _get_device_registry(self):
         """获取设备注册表（带缓存）"""
@@ -384,12 +540,12 @@ class WindowControllerDeviceManager:
         """处理单个设备"""
         device_sn, device_name = device_info
         # 直接添加到设备字典中
-        self.devices[device_sn] = {
+        self._set_device(device_sn, {
             "name": device_name,
             "type": DEVICE_TYPE_WINDOW_OPENER,
             "status": "online",
             "attributes": {}
-        }
+        })
         _LOGGER.debug("快速加载设备: %s, 名称: %s", device_sn, device_name)
     
     async def setup(self) -> bool:
@@ -525,13 +681,13 @@ class WindowControllerDeviceManager:
             )
             
             # 添加到设备列表
-            self.devices[device_sn] = {
+            self._set_device(device_sn, {
                 "sn": device_sn,
                 "name": device.name,
                 "type": DEVICE_TYPE_WINDOW_OPENER,
                 "status": "online",
                 "attributes": {}
-            }
+            })
             
             _LOGGER.info("设备重新关联成功: %s -> %s", device_sn, self.gateway_sn)
             
@@ -540,13 +696,13 @@ class WindowControllerDeviceManager:
     
     async def _process_device_async(self, device_sn, device):
         """异步处理单个设备"""
-        self.devices[device_sn] = {
+        self._set_device(device_sn, {
             "sn": device_sn,
             "name": device.name,
             "type": DEVICE_TYPE_WINDOW_OPENER,
             "status": "online",
             "attributes": {}
-        }
+        })
         _LOGGER.debug("加载设备: %s, 名称: %s", device_sn, device.name)
     
     async def _async_fast_register_device(self, device_sn: str, device_name: str):
@@ -760,8 +916,46 @@ class WindowControllerDeviceManager:
             self._device_removed_callbacks.append(callback)
             _LOGGER.debug("设备移除回调已添加")
     
+    def register_device_update_callback(
+        self, device_sn: str, callback: Callable[[Dict[str, Any]], None]
+    ) -> Callable[[], None]:
+        """注册设备状态更新回调，设备状态变化时直接推送给对应实体
+        
+        Args:
+            device_sn: 设备序列号
+            callback: 回调函数（需在事件循环中同步执行），接收设备记录作为参数
+            
+        Returns:
+            取消注册的函数
+        """
+        callbacks = self._device_update_callbacks.setdefault(device_sn, [])
+        callbacks.append(callback)
+        
+        def _unregister():
+            device_callbacks = self._device_update_callbacks.get(device_sn)
+            if device_callbacks and callback in device_callbacks:
+                device_callbacks.remove(callback)
+                if not device_callbacks:
+                    del self._device_update_callbacks[device_sn]
+        
+        return _unregister
+    
+    def _notify_device_update(self, device_sn: str):
+        """通知指定设备的状态更新回调"""
+        callbacks = self._device_update_callbacks.get(device_sn)
+        if not callbacks:
+            return
+        device = self.devices[device_sn]
+        for callback in list(callbacks):
+            try:
+                callback(device)
+            except Exception as e:
+                _LOGGER.error("调用设备 %s 状态更新回调失败: %s", device_sn, e)
+    
     async def add_device(self, device_sn: str, device_name: str, device_type: str = None, force: bool = False):
         """添加设备 - 只支持开窗器类型"""
+        # 驻留设备SN，后续所有使用方共享同一个字符串对象
+        device_sn = sys.intern(device_sn)
         # 检查设备是否在手动删除列表中
         # 如果是手动删除的设备，不自动添加回来
         if not force and device_sn in self._manually_removed_devices:
@@ -806,18 +1000,17 @@ class WindowControllerDeviceManager:
                 
                 # 更新设备到网关映射表
                 if DEVICE_TO_GATEWAY_MAPPING in self.hass.data[DOMAIN]:
-                    device_to_gateway_mapping = self.hass.data[DOMAIN][DEVICE_TO_GATEWAY_MAPPING]
-                    device_to_gateway_mapping[device_sn] = self.gateway_sn
+                    set_device_gateway_mapping(self.hass, device_sn, self.gateway_sn)
                     _LOGGER.info("已更新设备 %s 的网关映射到 %s", device_sn, self.gateway_sn)
                 
                 # 更新设备在 self.devices 中的信息
-                self.devices[device_sn] = {
+                self._set_device(device_sn, {
                     "sn": device_sn,
                     "name": device_name_with_sn,
                     "type": device_type,
                     "online": True,
                     "last_update": time.time()
-                }
+                })
                 _LOGGER.info("已更新设备 %s 在设备管理器中的信息", device_sn)
                 
                 # 触发设备添加回调，确保实体被创建
@@ -842,6 +1035,10 @@ class WindowControllerDeviceManager:
                         return None
             
             # 更新设备类型为开窗器
+            old_type = self.devices[device_sn].get("type")
+            if old_type != device_type:
+                self._by_type[old_type].pop(device_sn, None)
+                self._by_type[device_type][device_sn] = None
             self.devices[device_sn]["type"] = device_type
             # 更新设备名称
             self.devices[device_sn]["name"] = self._format_device_name(device_sn, device_name)
@@ -906,7 +1103,7 @@ class WindowControllerDeviceManager:
             "attributes": {}
         }
         
-        self.devices[device_sn] = device_info
+        self._set_device(device_sn, device_info)
         
         # 创建设备注册
         device = None
@@ -946,17 +1143,18 @@ class WindowControllerDeviceManager:
                     self.hass.create_task(callback(device_sn, device_name_with_sn, device_type))
                 except Exception as e:
                     _LOGGER.error("调用设备添加回调失败: %s", e)
-            _LOGGER.info("开窗器设备添加成功 (内存中): %s (%s)", device_name_with_sn, device_sn)
+            if _LOGGER.isEnabledFor(logging.DEBUG):
+                _LOGGER.debug("开窗器设备添加成功 (内存中): %s (%s)", device_name_with_sn, device_sn)
             return device_sn
         
         if device:
-            _LOGGER.info("开窗器设备添加成功: %s (%s)", device_name_with_sn, device_sn)
+            if _LOGGER.isEnabledFor(logging.DEBUG):
+                _LOGGER.debug("开窗器设备添加成功: %s (%s)", device_name_with_sn, device_sn)
             
             # 将设备SN和网关SN的映射关系存储到hass.data中
-            if DEVICE_TO_GATEWAY_MAPPING not in self.hass.data[DOMAIN]:
-                self.hass.data[DOMAIN][DEVICE_TO_GATEWAY_MAPPING] = {}
-            self.hass.data[DOMAIN][DEVICE_TO_GATEWAY_MAPPING][device_sn] = self.gateway_sn
-            _LOGGER.info("设备 %s 已添加到网关 %s，已更新映射关系", device_sn, self.gateway_sn)
+            set_device_gateway_mapping(self.hass, device_sn, self.gateway_sn)
+            if _LOGGER.isEnabledFor(logging.DEBUG):
+                _LOGGER.debug("设备 %s 已添加到网关 %s，已更新映射关系", device_sn, self.gateway_sn)
             
             # 调用所有设备添加回调，通知需要添加新实体
             for callback in self._device_added_callbacks:
@@ -976,9 +1174,39 @@ class WindowControllerDeviceManager:
                     self.hass.create_task(callback(device_sn, device_name_with_sn, device_type))
                 except Exception as e:
                     _LOGGER.error("调用设备添加回调失败: %s", e)
-            _LOGGER.info("开窗器设备添加成功 (内存中): %s (%s)", device_name_with_sn, device_sn)
+            if _LOGGER.isEnabledFor(logging.DEBUG):
+                _LOGGER.debug("开窗器设备添加成功 (内存中): %s (%s)", device_name_with_sn, device_sn)
             return device_sn
     
+    async def add_devices_bulk(self, specs: List[Tuple[str, str]]) -> List[Any]:
+        """批量添加开窗器设备
+        
+        一次性获取设备注册表后分批并发添加设备，每批最多 _BULK_ADD_BATCH_SIZE 个，
+        在限制并发量的同时避免逐个等待设备和实体的创建
+        
+        Args:
+            specs: (device_sn, device_name) 元组列表
+            
+        Returns:
+            每个设备对应的add_device返回值，添加失败的设备为None
+        """
+        await self._get_device_registry()
+        results = []
+        batch_size = self._BULK_ADD_BATCH_SIZE
+        for i in range(0, len(specs), batch_size):
+            batch = specs[i:i + batch_size]
+            batch_results = await asyncio.gather(
+                *(self.add_device(device_sn, device_name, DEVICE_TYPE_WINDOW_OPENER) for device_sn, device_name in batch),
+                return_exceptions=True
+            )
+            for (device_sn, _), result in zip(batch, batch_results):
+                if isinstance(result, Exception):
+                    _LOGGER.error("批量添加设备 %s 失败: %s", device_sn, result)
+                    result = None
+                results.append(result)
+        _LOGGER.debug("批量添加设备完成，共 %d 个", len(specs))
+        return results
+    
     def _get_device_model(self, device_type: str) -> str:
         """根据设备类型获取模型名称"""
         # 只支持开窗器设备
@@ -998,6 +1226,7 @@ class WindowControllerDeviceManager:
             device_type = device_info.get("type")
             
             # 从内存中删除设备
+            self._by_type[device_type].pop(device_sn, None)
             del self.devices[device_sn]
             _LOGGER.info("设备移除: %s", device_sn)
             
@@ -1084,22 +1313,36 @@ class WindowControllerDeviceManager:
     async def update_device_status(self, device_sn: str, status: str, attributes: Optional[Dict[str, Any]] = None):
         """更新设备状态"""
         try:
-            if device_sn in self.devices:
-                self.devices[device_sn]["status"] = status
-                self.devices[device_sn]["last_update"] = time.time()
+            device = self.devices.get(device_sn)
+            if device is not None:
+                # 每次上报都刷新最后上报时间，用于判断设备是否仍在上报
+                device["last_update"] = time.time()
+                changed = device.get("status") != status
                 if attributes:
-                    # 直接更新属性，后收到的上报会覆盖先前的值
+                    # 只更新实际变化的属性，后收到的上报会覆盖先前的值
                     # 这样确保使用最后上报的r_travel值代表窗户当前状态
-                    if "attributes" not in self.devices[device_sn]:
-                        self.devices[device_sn]["attributes"] = {}
-                    self.devices[device_sn]["attributes"].update(attributes)
-                    # 特别记录r_travel的更新
-                    if "r_travel" in attributes:
-                        _LOGGER.debug("设备 %s 位置更新: %d", device_sn, attributes["r_travel"])
-                    # 特别记录voltage的更新
-                    if "voltage" in attributes:
-                        _LOGGER.debug("设备 %s 电压更新: %.1fV", device_sn, attributes["voltage"])
+                    device_attributes = device.setdefault("attributes", {})
+                    changed_attributes = {
+                        key: value for key, value in attributes.items()
+                        if key not in device_attributes or device_attributes[key] != value
+                    }
+                    if changed_attributes:
+                        device_attributes.update(changed_attributes)
+                        changed = True
+                        # 特别记录r_travel的更新
+                        if "r_travel" in changed_attributes:
+                            _LOGGER.debug("设备 %s 位置更新: %d", device_sn, changed_attributes["r_travel"])
+                        # 特别记录voltage的更新
+                        if "voltage" in changed_attributes:
+                            _LOGGER.debug("设备 %s 电压更新: %.1fV", device_sn, changed_attributes["voltage"])
+                # 状态和属性都未变化（如重复上报），不递增修订号也不通知实体
+                if not changed:
+                    return
+                device["status"] = status
+                # 递增修订号，实体据此跳过未变化的轮询
+                device["_rev"] = device.get("_rev", 0) + 1
                 _LOGGER.debug("设备状态更新: %s -> %s", device_sn, status)
+                self._notify_device_update(device_sn)
             else:
                 # 设备不存在，尝试添加
                 _LOGGER.debug("设备 %s 不存在，尝试添加", device_sn)
@@ -1110,11 +1353,14 @@ class WindowControllerDeviceManager:
                 # 再次尝试更新状态
                 if device_sn in self.devices:
                     self.devices[device_sn]["status"] = status
+                    self.devices[device_sn]["last_update"] = time.time()
                     if attributes:
                         if "attributes" not in self.devices[device_sn]:
                             self.devices[device_sn]["attributes"] = {}
                         self.devices[device_sn]["attributes"].update(attributes)
+                    self.devices[device_sn]["_rev"] = self.devices[device_sn].get("_rev", 0) + 1
                     _LOGGER.info("设备 %s 已添加并更新状态", device_sn)
+                    self._notify_device_update(device_sn)
         except Exception as e:
             _LOGGER.error("更新设备状态失败: %s", e)
             # 即使失败，也尝试记录错误状态
@@ -1129,15 +1375,34 @@ class WindowControllerDeviceManager:
         """获取设备信息"""
         return self.devices.get(device_sn)
         
-    def get_all_devices(self) -> List[Dict[str, Any]]:
-        """获取所有设备"""
-        # 返回设备列表的浅拷贝，避免外部修改影响内部状态
-        return [device.copy() for device in self.devices.values()]
+    def get_all_devices(self) -> ValuesView[Dict[str, Any]]:
+        """获取所有设备
+        
+        返回设备字典的只读视图而不是复制列表。设备只在事件循环中增删，
+        同一事件循环中同步迭代是安全的；需要跨await保留或修改的调用方应自行 list(...) 快照
+        """
+        return self.devices.values()
+    
+    def iter_devices_by_type(self, device_type: str) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """按设备类型迭代设备
+        
+        通过类型索引直接定位设备，不复制设备列表也不扫描全部设备。
+        返回的是内部设备记录的引用，调用方不应修改，也不应在迭代过程中等待（await）
+        
+        Args:
+            device_type: 设备类型
+            
+        Returns:
+            (device_sn, device) 元组的迭代器
+        """
+        return ((device_sn, self.devices[device_sn]) for device_sn in self._by_type.get(device_type, ()))
         
     async def cleanup(self):
         """清理资源"""
         _LOGGER.info("清理设备管理器资源")
+        await self.command_batcher.stop()
         self.devices.clear()
+        self._by_type.clear()
         self._device_registry_cache = None
         # 更彻底的回调清理
         self._device_added_callbacks = []
@@ -1564,12 +1829,8 @@ class WindowControllerDeviceManager:
         
         # 5.3 更新设备到网关映射表
         if migrated_devices:
-            if DEVICE_TO_GATEWAY_MAPPING not in self.hass.data[DOMAIN]:
-                self.hass.data[DOMAIN][DEVICE_TO_GATEWAY_MAPPING] = {}
-            
-            device_to_gateway_mapping = self.hass.data[DOMAIN][DEVICE_TO_GATEWAY_MAPPING]
             for device_sn in migrated_devices:
-                device_to_gateway_mapping[device_sn] = new_gateway_sn  # 更新映射！
+                set_device_gateway_mapping(self.hass, device_sn, new_gateway_sn)  # 更新映射！
             
             _LOGGER.info("已更新 %d 个设备的网关映射", len(migrated_devices))
         
@@ -1979,12 +2240,10 @@ class WindowControllerDeviceManager:
             
             # 3. 恢复设备到网关映射表
             if DEVICE_TO_GATEWAY_MAPPING in self.hass.data[DOMAIN]:
-                device_to_gateway_mapping = self.hass.data[DOMAIN][DEVICE_TO_GATEWAY_MAPPING]
-                
                 # 查找所有需要回滚的设备
                 old_gateway_devices = await self._get_gateway_devices_from_registry(self.gateway_sn)
                 for device_sn in old_gateway_devices:
-                    device_to_gateway_mapping[device_sn] = old_gateway_sn
+                    set_device_gateway_mapping(self.hass, device_sn, old_gateway_sn)
                     _LOGGER.info("已恢复设备 %s 的网关映射到旧网关", device_sn)
             
             _LOGGER.info("迁移回滚完成")
@@ -2107,8 +2366,7 @@ class WindowControllerDeviceManager:
                         
                         # 先更新设备到网关映射表，将设备从旧网关映射到新网关
                         if DEVICE_TO_GATEWAY_MAPPING in self.hass.data[DOMAIN]:
-                            device_to_gateway_mapping = self.hass.data[DOMAIN][DEVICE_TO_GATEWAY_MAPPING]
-                            device_to_gateway_mapping[device_sn] = self.gateway_sn
+                            set_device_gateway_mapping(self.hass, device_sn, self.gateway_sn)
                             _LOGGER.info("设备 %s 的网关映射已更新为 %s", device_sn, self.gateway_sn)
                         
                         # 将设备添加到当前网关的设备列表中（使用 force=True 跳过检查）
@@ -1,6 +1,8 @@
 """开窗器网关实体"""
 import logging
 import asyncio
+import sys
+from functools import cached_property
 from typing import Optional
 
 from homeassistant.core import HomeAssistant
@@ -56,7 +58,7 @@ class GatewayOnlineSensor(BinarySensorEntity):
         self.entry_id = entry_id
         self._attr_name = f"{gateway_name} 在线"
         # unique_id基于网关SN，确保同一网关只有一个在线状态传感器
-        self._attr_unique_id = f"{gateway_sn}_online"
+        self._attr_unique_id = sys.intern(f"{gateway_sn}_online")
         self._attr_device_class = BinarySensorDeviceClass.CONNECTIVITY
         self._attr_is_on = False
         # 添加图标
@@ -71,9 +73,9 @@ class GatewayOnlineSensor(BinarySensorEntity):
         # 初始状态更新
         self._update_state()
     
-    @property
+    @cached_property
     def device_info(self) -> DeviceInfo:
-        """返回设备信息"""
+        """返回设备信息（网关名称和序列号在实体生命周期内不变，可缓存）"""
         return DeviceInfo(
             identifiers={(DOMAIN, self.gateway_sn)},
             name=self.gateway_name,
@@ -90,7 +92,12 @@ class GatewayOnlineSensor(BinarySensorEntity):
     
     def _on_status_change(self):
         """当MQTT状态改变时调用"""
-        self._update_state()
+        # 连接状态未变化时（如重连风暴或配对状态通知）不写入状态
+        connected = self.mqtt_handler.connected
+        if connected == self._attr_is_on:
+            return
+        self._attr_is_on = connected
+        _LOGGER.debug("网关 %s 在线状态更新为: %s", self.gateway_sn, connected)
         # 通知Home Assistant状态已更新
         # 使用schedule_update_ha_state确保在事件循环线程中执行
         try:
@@ -131,13 +138,13 @@ class GatewayPairingButton(ButtonEntity):
         self.entry_id = entry_id
         self._attr_name = f"{gateway_name} 配对"
         # unique_id基于网关SN，确保同一网关只有一个配对按钮
-        self._attr_unique_id = f"{gateway_sn}_pairing"
+        self._attr_unique_id = sys.intern(f"{gateway_sn}_pairing")
         # 添加图标
         self._attr_icon = "mdi:plus-circle"
     
-    @property
+    @cached_property
     def device_info(self) -> DeviceInfo:
-        """返回设备信息 - 与网关关联"""
+        """返回设备信息 - 与网关关联（可缓存）"""
         return DeviceInfo(
             identifiers={(DOMAIN, self.gateway_sn)},
             name=self.gateway_name,
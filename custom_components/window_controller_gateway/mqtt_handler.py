@@ -3,11 +3,11 @@ import logging
 import json
 import asyncio
 import random
+import time
 import weakref
-from datetime import datetime
-from typing import Dict, Any, Optional, Callable, Union
+from typing import Dict, Any, Optional, Callable, Iterable, Tuple, Union
 
-from homeassistant.core import HomeAssistant
+from homeassistant.core import HomeAssistant, callback
 from homeassistant.components import mqtt
 
 from .const import (
@@ -18,12 +18,14 @@ from .const import (
     ATTR_BATTERY,
     DEVICE_TYPE_WINDOW_OPENER,
     GATEWAY_CHECK_INTERVAL,
+    STATUS_COALESCE_INTERVAL,
     INITIAL_RETRY_DELAY,
     MQTT_MAX_RETRIES,
     MQTT_MIN_JITTER,
     MQTT_MAX_JITTER,
     MQTT_RETRY_DELAY_MAX,
     MQTT_BATCH_SIZE,
+    MQTT_MAX_INFLIGHT,
     MAX_COMMAND_ID,
     PROTOCOL_HEAD,
     DEVICE_TYPE_CURTAIN_CTR,
@@ -32,11 +34,69 @@ from .const import (
     COMMAND_VALUE_CLOSE,
     COMMAND_VALUE_STOP,
     COMMAND_VALUE_TOGGLE,
-    ATTRIBUTE_W_TRAVEL
+    ATTRIBUTE_W_TRAVEL,
+    COMMAND_OPEN,
+    COMMAND_CLOSE,
+    COMMAND_STOP,
+    COMMAND_A,
+    COMMAND_SET_POSITION,
+    COMMAND_DISCOVER,
+    COMMAND_START_PAIRING,
+    GATEWAY_STATUS_ONLINE,
+    GATEWAY_STATUS_OFFLINE,
+    GATEWAY_STATUS_PAIRING
 )
+from .utils import get_configured_gateway_sns, get_configured_gateway_sn_bytes
 
 _LOGGER = logging.getLogger(__name__)
 
+# 优先使用orjson编解码MQTT负载（可直接解析bytes），未安装时回退到标准库json
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+if orjson is not None:
+    _json_loads = orjson.loads
+    _json_dumps = orjson.dumps
+else:
+    _json_loads = json.loads
+    _json_dumps = json.dumps
+
+# 命令类型到协议ctype的映射（根据协议文档）
+_COMMAND_MAP = {
+    "bind_gateway": "001",  # 001: 绑定网关
+    COMMAND_START_PAIRING: "003",  # 003: 绑定子设备
+    COMMAND_DISCOVER: "002",  # 002: 网关状态上报/设备发现
+    COMMAND_OPEN: "004",  # 004: 设备控制
+    COMMAND_CLOSE: "004",  # 004: 设备控制
+    COMMAND_STOP: "004",  # 004: 设备控制
+    COMMAND_A: "004",  # 004: 设备控制
+    COMMAND_SET_POSITION: "004"  # 004: 设备控制
+}
+# 支持的命令类型
+_VALID_COMMANDS = frozenset(_COMMAND_MAP)
+# 发往网关本身、不需要检查子设备是否存在的命令
+_GATEWAY_COMMANDS = frozenset({"bind_gateway", COMMAND_START_PAIRING, COMMAND_DISCOVER})
+# 网关状态回调在回调表中使用的键
+_GATEWAY_CALLBACK_KEY = "gateway"
+
+# 网关绑定(001)响应中使用的固定uuid
+_BIND_RESPONSE_UUID = "4bc297c6-308d-4397-b1d6-2ef6ccc329d3"
+
+# 原有格式设备状态消息中直接透传的属性
+_STATUS_ATTRS = (ATTR_POSITION, ATTR_BATTERY)
+# 005设备上报中直接透传的字段：(上报字段, 存储属性)
+_REPORT_ATTRS = (("position", ATTR_POSITION), ("state", "state"))
+
+# 控制命令到w_travel属性值的映射
+_CONTROL_COMMANDS = {
+    COMMAND_OPEN: COMMAND_VALUE_OPEN,
+    COMMAND_CLOSE: COMMAND_VALUE_CLOSE,
+    COMMAND_STOP: COMMAND_VALUE_STOP,
+    COMMAND_A: COMMAND_VALUE_TOGGLE
+}
+
 class WindowControllerMQTTHandler:
     """MQTT处理器类 - 使用HA内置MQTT"""
     
@@ -47,7 +107,7 @@ class WindowControllerMQTTHandler:
         self.device_manager = device_manager
         self.connected = False
         self.pairing_active = False
-        self.last_gateway_report_time = None  # 最后收到网关002上报的时间
+        self.last_gateway_report_time = None  # 最后收到网关上报的时间（time.monotonic()）
         from .const import DEFAULT_COMMAND_ID, TOPIC_GATEWAY_REQ_FORMAT, TOPIC_GATEWAY_RSP
         self.command_id = DEFAULT_COMMAND_ID  # 命令ID初始值
         self._check_task = None  # 后台任务引用
@@ -56,8 +116,49 @@ class WindowControllerMQTTHandler:
         self.TOPIC_GATEWAY_REQ = TOPIC_GATEWAY_REQ_FORMAT.format(gateway_sn=gateway_sn)  # 发送命令到网关
         self.TOPIC_GATEWAY_RSP = TOPIC_GATEWAY_RSP  # 接收网关数据和响应，同时用于发送响应
         
-        # 状态更新回调 - 使用字典按设备SN组织回调
-        self._status_callbacks = {}
+        # 心跳消息只有时间戳会变化，预先编码固定的前缀
+        self._heartbeat_prefix = (
+            '{"gateway_sn":%s,"type":"heartbeat","timestamp":"' % json.dumps(gateway_sn)
+        ).encode()
+        # 网关SN的字节形式，用于在解析JSON前粗筛共享主题上的消息
+        self._sn_bytes = gateway_sn.encode()
+        # 网关绑定(001)响应只有id会变化，预先编码id前后的固定部分
+        self._bind_rsp_prefix = ('{"head":%s,"ctype":"001","id":' % json.dumps(PROTOCOL_HEAD)).encode()
+        self._bind_rsp_suffix = (
+            ',"sn":%s,"data":{"errcode":0,"uuid":"%s"}}' % (json.dumps(gateway_sn), _BIND_RESPONSE_UUID)
+        ).encode()
+        
+        # 状态更新回调 - 使用字典按设备SN组织回调弱引用集合，普通函数与协程函数分开存放
+        self._status_callbacks: Dict[str, set] = {}
+        self._coro_status_callbacks: Dict[str, set] = {}
+        
+        # 标准协议消息按ctype分发的处理函数表，只在初始化时构建一次
+        self._ctype_handlers = {
+            "001": self._handle_ctype_001,
+            "002": self._handle_ctype_002,
+            "003": self._handle_ctype_003,
+            "004": self._handle_ctype_004,
+            "005": self._handle_ctype_005,
+            "006": self._handle_ctype_006,
+            "007": self._handle_ctype_007,
+            "008": self._handle_ctype_008,
+            "009": self._handle_ctype_009,
+            "010": self._handle_ctype_010
+        }
+        # 原有格式消息按type分发的处理函数表（向后兼容）
+        self._legacy_handlers = {
+            "device_discovery": self._handle_legacy_device_discovery,
+            "device_status": self._handle_legacy_device_status
+        }
+        
+        # 限制同时在途的命令发布数量，避免批量控制时压垮MQTT代理
+        self.inflight_semaphore = asyncio.Semaphore(MQTT_MAX_INFLIGHT)
+        
+        # 合并窗口内待应用的设备上报：device_sn -> (status, attributes)
+        self._pending_updates: Dict[str, Tuple[str, Dict[str, Any]]] = {}
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        # 配对超时定时器
+        self._pairing_timeout_handle: Optional[asyncio.TimerHandle] = None
     
     async def setup(self):
         """设置MQTT处理器"""
@@ -85,14 +186,14 @@ class WindowControllerMQTTHandler:
                     from .const import GATEWAY_TIMEOUT_SECONDS
                     # 检查是否超过超时时间没有收到上报
                     if self.last_gateway_report_time:
-                        time_diff = datetime.now() - self.last_gateway_report_time
-                        if time_diff.total_seconds() > GATEWAY_TIMEOUT_SECONDS:  # 网关超时时间
+                        time_diff = time.monotonic() - self.last_gateway_report_time
+                        if time_diff > GATEWAY_TIMEOUT_SECONDS:  # 网关超时时间
                             if self.connected:
                                 self.connected = False
                                 self._notify_status_change()
                                 _LOGGER.warning("网关 %s 超过%s秒未上报，标记为离线", self.gateway_sn, GATEWAY_TIMEOUT_SECONDS)
-                                self.hass.create_task(
-                                    self.device_manager.update_gateway_status("offline")
+                                self.hass.async_create_task(
+                                    self.device_manager.update_gateway_status(GATEWAY_STATUS_OFFLINE)
                                 )
                 except Exception as e:
                     _LOGGER.error("检查网关超时出错: %s", e)
@@ -102,124 +203,102 @@ class WindowControllerMQTTHandler:
         except Exception as e:
             _LOGGER.error("网关超时检查任务异常: %s", e)
     
-    async def _subscribe_topics(self):
-        """订阅MQTT主题 - 根据协议要求简化为只订阅网关响应主题"""
-        # 订阅网关响应和数据主题
-        def handle_gateway_response(msg):
-            """处理网关响应和数据消息"""
-            try:
-                payload = json.loads(msg.payload)
+    def _trigger_gateway_discovery(self, response_sn):
+        """收到未配置网关的消息时触发网关发现"""
+        try:
+            from .discovery import async_discover_gateway
+            gateway_name = f"网关 {response_sn[-6:]}"
+            
+            # 检查是否处于替换模式
+            replace_mode = False
+            for flow in self.hass.config_entries.flow.async_progress():
+                if flow["handler"] == DOMAIN and flow.get("context", {}).get("source") == "replace_gateway":
+                    replace_mode = True
+                    break
+            
+            # 触发网关发现，传入替换模式标志
+            self.hass.async_create_task(
+                async_discover_gateway(self.hass, response_sn, gateway_name, replace_mode, self.gateway_sn)
+            )
+        except Exception as e:
+            _LOGGER.error("触发未配置网关发现失败: %s", e)
+    
+    @callback
+    def _handle_gateway_response(self, msg):
+        """处理网关响应和数据消息"""
+        # 每条消息都会用到的属性先绑定为局部变量
+        gateway_sn = self.gateway_sn
+        raw = msg.payload
+        # 共享主题上不含本网关SN、但含有其他已配置网关SN的消息由对应的处理器负责，
+        # 无需解析；未配置网关的消息仍需解析以触发网关发现
+        if self._sn_bytes not in raw and any(
+            sn_bytes in raw for sn_bytes in get_configured_gateway_sn_bytes(self.hass)
+        ):
+            return
+        try:
+            payload = _json_loads(raw)
+            if _LOGGER.isEnabledFor(logging.DEBUG):
                 _LOGGER.debug("收到网关消息: %s", payload)
-                
-                # 检查是否是标准协议格式（带head和ctype字段）
-                if "head" in payload and "ctype" in payload:
-                    # 标准协议格式处理
-                    ctype = payload.get("ctype")
-                    data = payload.get("data", {})
-                    
-                    # 检查响应是否来自此网关
-                    response_sn = payload.get("sn")
-                    if not response_sn:
-                        return
-                    
-                    # 如果是来自未配置网关的消息，触发网关发现
-                    if response_sn != self.gateway_sn:
-                        try:
-                            from .discovery import async_discover_gateway
-                            gateway_name = f"网关 {response_sn[-6:]}"
-                            
-                            # 检查是否处于替换模式
-                            replace_mode = False
-                            for flow in self.hass.config_entries.flow.async_progress():
-                                if flow["handler"] == DOMAIN and flow.get("context", {}).get("source") == "replace_gateway":
-                                    replace_mode = True
-                                    break
-                            
-                            # 触发网关发现，传入替换模式标志
-                            self.hass.create_task(
-                                async_discover_gateway(self.hass, response_sn, gateway_name, replace_mode, self.gateway_sn)
-                            )
-                        except Exception as e:
-                            _LOGGER.error("触发未配置网关发现失败: %s", e)
-                        return
-                    
-                    # 更新最后上报时间 - 只要收到网关消息就认为在线
-                    self.last_gateway_report_time = datetime.now()
-                    
-                    # 只要收到网关消息就认为在线，更新connected状态
-                    if not self.connected:
-                        self.connected = True
-                        self._notify_status_change()
-                        _LOGGER.info("网关 %s 收到消息，标记为在线", self.gateway_sn)
-                    
-                    # 根据不同的消息类型调用相应的处理函数
-                    ctype_handlers = {
-                        "001": self._handle_ctype_001,
-                        "002": self._handle_ctype_002,
-                        "003": self._handle_ctype_003,
-                        "004": self._handle_ctype_004,
-                        "005": self._handle_ctype_005,
-                        "006": self._handle_ctype_006,
-                        "007": self._handle_ctype_007,
-                        "008": self._handle_ctype_008,
-                        "009": self._handle_ctype_009,
-                        "010": self._handle_ctype_010
-                    }
-                    
-                    if ctype in ctype_handlers:
-                        self.hass.create_task(ctype_handlers[ctype](payload, ctype, data))
-                    else:
-                        _LOGGER.warning("未知的消息类型: %s", ctype)
-                    
-                    return
-                
-                # 处理原有格式的响应（向后兼容）
-                gateway_sn = payload.get("gateway_sn")
-                if not gateway_sn or gateway_sn != self.gateway_sn:
+            
+            # 不带head字段的是原有格式的响应（向后兼容）：未知类型或其他网关的消息直接忽略
+            if "head" not in payload:
+                legacy_handler = self._legacy_handlers.get(payload.get("type"))
+                if legacy_handler is None or payload.get("gateway_sn") != gateway_sn:
                     return
+                legacy_handler(payload)
+                return
+            
+            # 标准协议格式处理，缺少ctype的消息不再落入原有格式分支
+            ctype = payload.get("ctype")
+            if ctype is None:
+                return
+            data = payload.get("data", {})
+            
+            # 检查响应是否来自此网关
+            response_sn = payload.get("sn")
+            if not response_sn:
+                return
+            
+            if response_sn != gateway_sn:
+                # 共享主题上其他已配置网关的消息由对应的处理器负责，
+                # 只有来自未配置网关的消息才触发网关发现
+                if response_sn not in get_configured_gateway_sns(self.hass):
+                    self._trigger_gateway_discovery(response_sn)
+                return
+            
+            # 更新最后上报时间 - 只要收到网关消息就认为在线
+            self.last_gateway_report_time = time.monotonic()
+            
+            # 只要收到网关消息就认为在线，更新connected状态
+            if not self.connected:
+                self.connected = True
+                self._notify_status_change()
+                _LOGGER.info("网关 %s 收到消息，标记为在线", gateway_sn)
+            
+            # 根据不同的消息类型调用相应的处理函数
+            handler = self._ctype_handlers.get(ctype)
+            if handler is not None:
+                self.hass.async_create_task(handler(payload, ctype, data))
+            else:
+                _LOGGER.warning("未知的消息类型: %s", ctype)
                 
-                response_type = payload.get("type")
-                
-                if response_type == "device_discovery":
-                    devices = payload.get("devices", [])
-                    for device_info in devices:
-                        device_sn = device_info.get(ATTR_DEVICE_SN)
-                        device_name = device_info.get(ATTR_DEVICE_NAME, f"设备 {device_sn[-6:]}")
-                        device_type = device_info.get("device_type", DEVICE_TYPE_WINDOW_OPENER)
-                        
-                        self.hass.create_task(
-                            self.device_manager.add_device(device_sn, device_name, device_type)
-                        )
-                        
-                elif response_type == "device_status":
-                    device_sn = payload.get(ATTR_DEVICE_SN)
-                    if not device_sn:
-                        return
-                    
-                    status = payload.get("status", "unknown")
-                    attributes = {}
-                    
-                    if ATTR_POSITION in payload:
-                        attributes[ATTR_POSITION] = payload[ATTR_POSITION]
-                    if ATTR_BATTERY in payload:
-                        attributes[ATTR_BATTERY] = payload[ATTR_BATTERY]
-                    
-                    self.hass.create_task(
-                        self.device_manager.update_device_status(device_sn, status, attributes)
-                    )
-                    
-            except json.JSONDecodeError:
-                _LOGGER.error("MQTT消息解析失败: %s", msg.payload)
-            except KeyError as e:
-                _LOGGER.error("MQTT消息缺少必要字段: %s", e)
-            except ValueError as e:
-                _LOGGER.error("MQTT消息数据格式错误: %s", e)
-            except Exception as e:
-                _LOGGER.error("处理网关消息时出错: %s", e)
-        
+        except json.JSONDecodeError:
+            _LOGGER.error("MQTT消息解析失败: %s", msg.payload)
+        except KeyError as e:
+            _LOGGER.error("MQTT消息缺少必要字段: %s", e)
+        except ValueError as e:
+            _LOGGER.error("MQTT消息数据格式错误: %s", e)
+        except Exception as e:
+            _LOGGER.error("处理网关消息时出错: %s", e)
+    
+    async def _subscribe_topics(self):
+        """订阅MQTT主题 - 根据协议要求简化为只订阅网关响应主题"""
+        # 订阅网关响应和数据主题
         try:
-            # 订阅网关响应主题
-            await mqtt.async_subscribe(self.hass, self.TOPIC_GATEWAY_RSP, handle_gateway_response, 1)
+            # 订阅网关响应主题：回调在事件循环中同步执行，负载保持bytes交给JSON解析器
+            await mqtt.async_subscribe(
+                self.hass, self.TOPIC_GATEWAY_RSP, self._handle_gateway_response, 1, encoding=None
+            )
             _LOGGER.debug("订阅网关消息主题: %s", self.TOPIC_GATEWAY_RSP)
         except ConnectionError as e:
             _LOGGER.error("MQTT连接失败: %s", e)
@@ -228,7 +307,32 @@ class WindowControllerMQTTHandler:
         except Exception as e:
             _LOGGER.error("订阅MQTT主题失败: %s", e)
             # 触发重连逻辑
-            self.hass.create_task(self._reconnect_mqtt())
+            self.hass.async_create_task(self._reconnect_mqtt())
+    
+    def _handle_legacy_device_discovery(self, payload):
+        """处理原有格式的设备发现消息"""
+        devices = payload.get("devices", [])
+        for device_info in devices:
+            device_sn = device_info.get(ATTR_DEVICE_SN)
+            device_name = device_info.get(ATTR_DEVICE_NAME, f"设备 {device_sn[-6:]}")
+            device_type = device_info.get("device_type", DEVICE_TYPE_WINDOW_OPENER)
+            
+            self.hass.async_create_task(
+                self.device_manager.add_device(device_sn, device_name, device_type)
+            )
+    
+    def _handle_legacy_device_status(self, payload):
+        """处理原有格式的设备状态消息"""
+        device_sn = payload.get(ATTR_DEVICE_SN)
+        if not device_sn:
+            return
+        
+        status = payload.get("status", "unknown")
+        attributes = {k: payload[k] for k in _STATUS_ATTRS if k in payload}
+        
+        self.hass.async_create_task(
+            self.device_manager.update_device_status(device_sn, status, attributes)
+        )
     
     async def _reconnect_mqtt(self):
         """MQTT重连逻辑 - 自适应重试策略，结合抖动和随机化"""
@@ -274,7 +378,7 @@ class WindowControllerMQTTHandler:
                     if self.connected:
                         self.connected = False
                         self._notify_status_change()
-                        self.hass.create_task(self.device_manager.update_gateway_status("offline"))
+                        self.hass.async_create_task(self.device_manager.update_gateway_status(GATEWAY_STATUS_OFFLINE))
                     return
     
     async def send_command(self, device_sn: str, command: str, params: Optional[Dict[str, Any]] = None) -> bool:
@@ -299,13 +403,12 @@ class WindowControllerMQTTHandler:
                 return False
             
             # 验证命令类型
-            valid_commands = ["bind_gateway", "start_pairing", "discover", "open", "close", "stop", "a", "set_position"]
-            if command not in valid_commands:
+            if command not in _VALID_COMMANDS:
                 _LOGGER.error("未知命令类型: %s", command)
                 return False
             
             # 检查设备是否存在
-            if command not in ["bind_gateway", "start_pairing", "discover"]:
+            if command not in _GATEWAY_COMMANDS:
                 device = self.device_manager.get_device(device_sn)
                 if not device:
                     _LOGGER.error("设备不存在，无法发送命令: %s", device_sn)
@@ -324,79 +427,67 @@ class WindowControllerMQTTHandler:
                     return False
             
             # 根据协议文档，使用标准的协议格式
-            command_map = {
-                "bind_gateway": "001",  # 001: 绑定网关
-                "start_pairing": "003",  # 003: 绑定子设备
-                "discover": "002",  # 002: 网关状态上报/设备发现
-                "open": "004",  # 004: 设备控制
-                "close": "004",  # 004: 设备控制
-                "stop": "004",  # 004: 设备控制
-                "a": "004",  # 004: 设备控制
-                "set_position": "004"  # 004: 设备控制
-            }
+            ctype = _COMMAND_MAP.get(command, "004")
             
-            ctype = command_map.get(command, "004")
+            # 根据命令类型一次性构建data
+            if command == COMMAND_START_PAIRING:
+                # 配对命令使用固定的配对参数，忽略额外参数
+                data = {
+                    "bind": 1,  # 新增字段
+                    "devtype": DEVICE_TYPE_CURTAIN_CTR,
+                    "sn": PAIRING_SN_PLACEHOLDER
+                }
+            else:
+                if command in _CONTROL_COMMANDS:
+                    # 控制命令需要包含子设备SN
+                    data = {
+                        "sn": device_sn,
+                        "attribute": ATTRIBUTE_W_TRAVEL,
+                        "value": _CONTROL_COMMANDS[command]
+                    }
+                elif command == COMMAND_SET_POSITION:
+                    # 设置位置命令
+                    position = (params or {}).get("position", 0)
+                    # 验证位置参数
+                    try:
+                        position = int(position)
+                        if position < 0 or position > 100:
+                            _LOGGER.warning("位置参数超出范围(0-100)，使用默认值0: %s", position)
+                            position = 0
+                    except (ValueError, TypeError):
+                        _LOGGER.warning("位置参数无效，使用默认值0: %s", position)
+                        position = 0
+                    data = {
+                        "sn": device_sn,
+                        "attribute": ATTRIBUTE_W_TRAVEL,
+                        "value": str(position)
+                    }
+                else:
+                    data = {}
+                
+                # 添加额外参数，命令本身的字段优先
+                if params:
+                    try:
+                        data = {**params, **data}
+                    except Exception as e:
+                        _LOGGER.error("更新额外参数失败: %s", e)
             
-            # 构建协议格式的payload
+            # 构建协议格式的payload，sn字段位于末尾
             payload = {
                 "head": PROTOCOL_HEAD,
                 "ctype": ctype,
                 "id": self.command_id,  # 使用自增ID
-                "data": {
-                }
+                "data": data,
+                "sn": self.gateway_sn
             }
-            
-            # 添加sn字段到payload的末尾
-            payload["sn"] = self.gateway_sn
-            
-            # 添加额外参数
-            if params:
-                try:
-                    payload["data"].update(params)
-                except Exception as e:
-                    _LOGGER.error("更新额外参数失败: %s", e)
-            
-            # 根据命令类型添加特定参数
-            if command == "start_pairing":
-                # 清空data并设置正确的配对参数
-                payload["data"] = {
-                    "bind": 1,  # 新增字段
-                    "devtype": DEVICE_TYPE_CURTAIN_CTR,
-                    "sn": PAIRING_SN_PLACEHOLDER
-                }
+            if command == COMMAND_START_PAIRING:
                 # 在顶层也添加bind字段
                 payload["bind"] = 1
-            elif command in ["open", "close", "stop", "a"]:
-                # 控制命令需要包含子设备SN
-                payload["data"]["sn"] = device_sn
-                payload["data"]["attribute"] = ATTRIBUTE_W_TRAVEL
-                if command == "open":
-                    payload["data"]["value"] = COMMAND_VALUE_OPEN
-                elif command == "close":
-                    payload["data"]["value"] = COMMAND_VALUE_CLOSE
-                elif command == "stop":
-                    payload["data"]["value"] = COMMAND_VALUE_STOP
-                elif command == "a":
-                    payload["data"]["value"] = COMMAND_VALUE_TOGGLE
-            elif command == "set_position":
-                # 设置位置命令
-                payload["data"]["sn"] = device_sn
-                payload["data"]["attribute"] = ATTRIBUTE_W_TRAVEL
-                position = params.get("position", 0)
-                # 验证位置参数
-                try:
-                    position = int(position)
-                    if position < 0 or position > 100:
-                        _LOGGER.warning("位置参数超出范围(0-100)，使用默认值0: %s", position)
-                        position = 0
-                except (ValueError, TypeError):
-                    _LOGGER.warning("位置参数无效，使用默认值0: %s", position)
-                    position = 0
-                payload["data"]["value"] = str(position)
             
             # 打印详细的命令信息
-            _LOGGER.debug("发送命令到网关: %s, 命令: %s, 设备SN: %s, 载荷: %s", 
-                          self.TOPIC_GATEWAY_REQ, command, device_sn, payload)
+            if _LOGGER.isEnabledFor(logging.DEBUG):
+                _LOGGER.debug("发送命令到网关: %s, 命令: %s, 设备SN: %s, 载荷: %s", 
+                              self.TOPIC_GATEWAY_REQ, command, device_sn, payload)
             
             # 递增ID，保持在合理范围内
             self.command_id += 1
@@ -407,7 +498,7 @@ class WindowControllerMQTTHandler:
                 await mqtt.async_publish(
                     self.hass,
                     self.TOPIC_GATEWAY_REQ,
-                    json.dumps(payload),
+                    _json_dumps(payload),
                     1,
                     False
                 )
@@ -426,6 +517,44 @@ class WindowControllerMQTTHandler:
     
 
     
+    @staticmethod
+    def _get_weak_ref(callback, on_dead=None):
+        """获取回调的弱引用，回调对象被回收时调用on_dead"""
+        if hasattr(callback, '__self__') and hasattr(callback, '__func__'):
+            # 实例方法
+            return weakref.WeakMethod(callback, on_dead)
+        # 普通函数
+        return weakref.ref(callback, on_dead)
+    
+    def _get_callback_table(self, callback) -> Dict[str, set]:
+        """根据回调类型返回对应的回调表，注册时只判断一次是否为协程函数"""
+        if asyncio.iscoroutinefunction(callback):
+            return self._coro_status_callbacks
+        return self._status_callbacks
+    
+    def _add_callback_ref(self, key: str, callback) -> bool:
+        """以弱引用登记回调，已存在时返回False"""
+        refs = self._get_callback_table(callback).setdefault(key, set())
+        # 使用弱引用存储回调，避免内存泄漏；回调对象被回收时自动从集合中移除
+        ref = self._get_weak_ref(callback, refs.discard)
+        if ref in refs:
+            return False
+        refs.add(ref)
+        return True
+    
+    def _remove_callback_ref(self, key: str, callback):
+        """移除回调，并清理失效的弱引用和空条目"""
+        table = self._get_callback_table(callback)
+        refs = table.get(key)
+        if refs is None:
+            return
+        # 活着的弱引用按引用对象比较相等，新建的弱引用即可定位已登记的条目
+        refs.discard(self._get_weak_ref(callback))
+        if not refs:
+            # 没有回调了，清理条目
+            del table[key]
+            _LOGGER.debug("清理 %s 的回调条目", key)
+    
     def add_status_callback(self, *args: Union[str, Callable[[Union[str, Dict[str, Any]], Any], None]]):
         """添加状态更新回调
         
@@ -433,58 +562,32 @@ class WindowControllerMQTTHandler:
         1. add_status_callback(device_sn, callback) - 为特定设备添加回调
         2. add_status_callback(callback) - 为网关添加回调
         
+        回调可以是普通函数或协程函数，注册时按类型分别存放
+        
         Args:
             *args: 可变参数，
                 - 方式1: (device_sn: str, callback: Callable)
                 - 方式2: (callback: Callable)
         """
-        def _get_weak_ref(callback):
-            """获取回调的弱引用"""
-            if hasattr(callback, '__self__') and hasattr(callback, '__func__'):
-                # 实例方法
-                return weakref.WeakMethod(callback)
-            else:
-                # 普通函数
-                return weakref.ref(callback)
-        
         if len(args) == 2:
             # 为特定设备添加回调
             device_sn, callback = args
-            if device_sn not in self._status_callbacks:
-                self._status_callbacks[device_sn] = []
-            
-            # 使用弱引用存储回调，避免内存泄漏
-            weak_callback = _get_weak_ref(callback)
-            # 检查是否已经存在相同的回调
-            callback_exists = False
-            for ref in self._status_callbacks[device_sn]:
-                if ref() == callback:
-                    callback_exists = True
-                    break
-            
-            if not callback_exists:
-                self._status_callbacks[device_sn].append(weak_callback)
+            if self._add_callback_ref(device_sn, callback):
                 _LOGGER.debug("为设备 %s 添加状态更新回调", device_sn)
         elif len(args) == 1:
-            # 为网关添加回调（向后兼容）
-            callback = args[0]
-            # 使用特殊键 "gateway" 存储网关回调
-            if "gateway" not in self._status_callbacks:
-                self._status_callbacks["gateway"] = []
-            
-            # 使用弱引用存储回调，避免内存泄漏
-            weak_callback = _get_weak_ref(callback)
-            # 检查是否已经存在相同的回调
-            callback_exists = False
-            for ref in self._status_callbacks["gateway"]:
-                if ref() == callback:
-                    callback_exists = True
-                    break
-            
-            if not callback_exists:
-                self._status_callbacks["gateway"].append(weak_callback)
+            # 为网关添加回调（向后兼容），使用特殊键存储
+            if self._add_callback_ref(_GATEWAY_CALLBACK_KEY, args[0]):
                 _LOGGER.debug("为网关添加状态更新回调")
 
+    def add_status_callbacks(self, callbacks: Iterable[Tuple[str, Callable]]):
+        """批量添加设备状态更新回调
+        
+        Args:
+            callbacks: (device_sn, callback) 元组序列
+        """
+        added = sum(1 for device_sn, callback in callbacks if self._add_callback_ref(device_sn, callback))
+        _LOGGER.debug("批量添加 %d 个设备状态更新回调", added)
+
     def remove_status_callback(self, *args: Union[str, Callable[[Union[str, Dict[str, Any]], Any], None]]):
         """移除状态更新回调
         
@@ -500,122 +603,60 @@ class WindowControllerMQTTHandler:
         if len(args) == 2:
             # 移除特定设备的回调
             device_sn, callback = args
-            if device_sn in self._status_callbacks:
-                # 找到并移除对应的弱引用
-                refs_to_remove = []
-                for ref in self._status_callbacks[device_sn]:
-                    if ref() == callback:
-                        refs_to_remove.append(ref)
-                
-                for ref in refs_to_remove:
-                    self._status_callbacks[device_sn].remove(ref)
-                    _LOGGER.debug("从设备 %s 移除状态更新回调", device_sn)
-                
-                # 清理无效的弱引用
-                valid_refs = []
-                for ref in self._status_callbacks[device_sn]:
-                    if ref() is not None:
-                        valid_refs.append(ref)
-                
-                if valid_refs:
-                    self._status_callbacks[device_sn] = valid_refs
-                else:
-                    # 如果设备没有回调了，清理设备条目
-                    del self._status_callbacks[device_sn]
-                    _LOGGER.debug("清理设备 %s 的回调条目", device_sn)
+            self._remove_callback_ref(device_sn, callback)
+            _LOGGER.debug("从设备 %s 移除状态更新回调", device_sn)
         elif len(args) == 1:
             # 移除网关的回调（向后兼容）
-            callback = args[0]
-            if "gateway" in self._status_callbacks:
-                # 找到并移除对应的弱引用
-                refs_to_remove = []
-                for ref in self._status_callbacks["gateway"]:
-                    if ref() == callback:
-                        refs_to_remove.append(ref)
-                
-                for ref in refs_to_remove:
-                    self._status_callbacks["gateway"].remove(ref)
-                    _LOGGER.debug("从网关移除状态更新回调")
-                
-                # 清理无效的弱引用
-                valid_refs = []
-                for ref in self._status_callbacks["gateway"]:
-                    if ref() is not None:
-                        valid_refs.append(ref)
-                
-                if valid_refs:
-                    self._status_callbacks["gateway"] = valid_refs
-                else:
-                    # 如果网关没有回调了，清理网关条目
-                    del self._status_callbacks["gateway"]
-                    _LOGGER.debug("清理网关的回调条目")
+            self._remove_callback_ref(_GATEWAY_CALLBACK_KEY, args[0])
+            _LOGGER.debug("从网关移除状态更新回调")
     
-    def _notify_status_change(self):
-        """通知状态变化 - 确保在事件循环线程中执行回调"""
-        # 此方法现在用于网关状态变化通知
-        # 设备状态变化通知使用 _notify_device_status_change
+    def _notify_callbacks(self, key: str):
+        """通知指定键的回调 - 不经过hass.add_job的类型判断直接投递
         
-        # 通知网关状态回调
-        if "gateway" in self._status_callbacks:
-            gateway_callbacks = self._status_callbacks["gateway"]
-            valid_callbacks = []
-            
-            for ref in gateway_callbacks:
+        所有通知路径都在事件循环中执行，普通函数通过call_soon排入下一轮循环调用，
+        协程函数直接创建任务
+        """
+        loop = self.hass.loop
+        for table, is_coro in ((self._status_callbacks, False), (self._coro_status_callbacks, True)):
+            refs = table.get(key)
+            if not refs:
+                continue
+            for ref in tuple(refs):
                 callback = ref()
-                if callback is not None:
-                    valid_callbacks.append(callback)
-                
-            # 清理无效的弱引用
-            self._status_callbacks["gateway"] = [ref for ref in gateway_callbacks if ref() is not None]
-            
-            for callback in valid_callbacks:
+                if callback is None:
+                    refs.discard(ref)
+                    continue
                 try:
-                    # 使用hass.add_job确保在事件循环线程中执行回调
-                    self.hass.add_job(callback)
+                    if is_coro:
+                        self.hass.async_create_task(callback())
+                    else:
+                        loop.call_soon(callback)
                 except Exception as e:
-                    _LOGGER.error("调用网关状态回调失败: %s", e)
+                    _LOGGER.error("调用 %s 状态回调失败: %s", key, e)
+            # 没有回调了则清理条目
+            if not refs:
+                del table[key]
+    
+    def _notify_status_change(self):
+        """通知网关状态变化 - 确保在事件循环线程中执行回调"""
+        # 此方法用于网关状态变化通知
+        # 设备状态变化通知使用 _notify_device_status_change
+        self._notify_callbacks(_GATEWAY_CALLBACK_KEY)
     
     def _notify_device_status_change(self, device_sn):
         """通知设备状态变化 - 确保在事件循环线程中执行回调"""
-        if device_sn in self._status_callbacks:
-            device_callbacks = self._status_callbacks[device_sn]
-            valid_callbacks = []
-            
-            for ref in device_callbacks:
-                callback = ref()
-                if callback is not None:
-                    valid_callbacks.append(callback)
-            
-            # 清理无效的弱引用
-            self._status_callbacks[device_sn] = [ref for ref in device_callbacks if ref() is not None]
-            
-            for callback in valid_callbacks:
-                try:
-                    # 使用hass.add_job确保在事件循环线程中执行回调
-                    self.hass.add_job(callback)
-                    _LOGGER.debug("通知设备 %s 状态更新回调", device_sn)
-                except Exception as e:
-                    _LOGGER.error("调用设备状态回调失败: %s", e)
-            
-            # 如果设备没有回调了，清理设备条目
-            if not self._status_callbacks[device_sn]:
-                del self._status_callbacks[device_sn]
-                _LOGGER.debug("清理设备 %s 的回调条目", device_sn)
+        self._notify_callbacks(device_sn)
     
     async def check_connection(self):
         """检查MQTT连接状态"""
         try:
-            # 发送一个心跳消息检查连接
-            payload = {
-                "gateway_sn": self.gateway_sn,
-                "type": "heartbeat",
-                "timestamp": datetime.now().isoformat()
-            }
+            # 发送一个心跳消息检查连接，只需拼接时间戳
+            payload = self._heartbeat_prefix + time.strftime("%Y-%m-%dT%H:%M:%S").encode() + b'"}'
             
             await mqtt.async_publish(
                 self.hass,
                 self.TOPIC_GATEWAY_REQ,
-                json.dumps(payload),
+                payload,
                 1,
                 False
             )
@@ -627,8 +668,8 @@ class WindowControllerMQTTHandler:
                 self._notify_status_change()
                 
                 # 更新网关状态
-                self.hass.create_task(
-                    self.device_manager.update_gateway_status("online")
+                self.hass.async_create_task(
+                    self.device_manager.update_gateway_status(GATEWAY_STATUS_ONLINE)
                 )
         except Exception as e:
             _LOGGER.error("MQTT连接检查失败: %s", e)
@@ -639,8 +680,8 @@ class WindowControllerMQTTHandler:
                 self._notify_status_change()
                 
                 # 更新网关状态
-                self.hass.create_task(
-                    self.device_manager.update_gateway_status("offline")
+                self.hass.async_create_task(
+                    self.device_manager.update_gateway_status(GATEWAY_STATUS_OFFLINE)
                 )
         
         return self.connected
@@ -659,23 +700,27 @@ class WindowControllerMQTTHandler:
         self._notify_status_change()
         
         # 更新网关状态
-        self.hass.create_task(
-            self.device_manager.update_gateway_status("pairing")
+        self.hass.async_create_task(
+            self.device_manager.update_gateway_status(GATEWAY_STATUS_PAIRING)
         )
         
         _LOGGER.info("配对命令已发送，持续时间: %d秒", duration)
         
-        # 设置定时器，在配对超时后恢复状态
-        async def pairing_timeout():
-            self.pairing_active = False
-            self._notify_status_change()
-            self.hass.create_task(
-                self.device_manager.update_gateway_status("online" if self.connected else "offline")
-            )
-            _LOGGER.info("配对模式已超时，恢复正常状态")
-        
-        # 延迟执行超时回调
-        self.hass.loop.call_later(duration, lambda: self.hass.create_task(pairing_timeout()))
+        # 设置定时器，在配对超时后恢复状态；重新配对时以最新一次为准
+        if self._pairing_timeout_handle is not None:
+            self._pairing_timeout_handle.cancel()
+        self._pairing_timeout_handle = self.hass.loop.call_later(duration, self._on_pairing_timeout)
+    
+    @callback
+    def _on_pairing_timeout(self):
+        """配对超时，恢复正常状态"""
+        self._pairing_timeout_handle = None
+        self.pairing_active = False
+        self._notify_status_change()
+        self.hass.async_create_task(
+            self.device_manager.update_gateway_status(GATEWAY_STATUS_ONLINE if self.connected else GATEWAY_STATUS_OFFLINE)
+        )
+        _LOGGER.info("配对模式已超时，恢复正常状态")
     
     async def unbind_device(self, device_sn: str):
         """解绑设备 - 使用协议类型003，bind=0"""
@@ -702,7 +747,7 @@ class WindowControllerMQTTHandler:
             await mqtt.async_publish(
                 self.hass,
                 self.TOPIC_GATEWAY_REQ,
-                json.dumps(payload),
+                _json_dumps(payload),
                 1,
                 False
             )
@@ -723,9 +768,7 @@ class WindowControllerMQTTHandler:
     
     async def fast_discovery(self):
         """快速设备发现 - 优化版，添加设备状态预查询逻辑"""
-        import asyncio
-        import time
-        start_time = time.time()
+        start_time = time.monotonic()
         
         # 1. 立即发送发现命令
         await self.send_command(self.gateway_sn, "discover")
@@ -735,7 +778,7 @@ class WindowControllerMQTTHandler:
         tasks = []
         
         # 任务1: 更新网关状态
-        tasks.append(self.device_manager.update_gateway_status("online"))
+        tasks.append(self.device_manager.update_gateway_status(GATEWAY_STATUS_ONLINE))
         _LOGGER.debug("快速发现: 添加网关状态更新任务")
         
         # 任务2: 批量查询所有已知设备状态（预查询）
@@ -757,7 +800,7 @@ class WindowControllerMQTTHandler:
             success_count = sum(1 for r in results if not isinstance(r, Exception))
             _LOGGER.debug("快速发现: 并行任务完成，成功: %d，总数: %d", success_count, len(tasks))
         
-        elapsed_time = time.time() - start_time
+        elapsed_time = time.monotonic() - start_time
         _LOGGER.info("快速设备发现完成，耗时: %.2f秒，预查询设备数: %d", elapsed_time, len(device_sns))
     
     async def cleanup(self):
@@ -768,8 +811,19 @@ class WindowControllerMQTTHandler:
             self._check_task.cancel()
             self._check_task = None
         
+        if self._pairing_timeout_handle is not None:
+            self._pairing_timeout_handle.cancel()
+            self._pairing_timeout_handle = None
+        
+        # 丢弃尚未应用的设备上报
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        self._pending_updates.clear()
+        
         # 清理所有回调引用，避免内存泄漏
         self._status_callbacks.clear()
+        self._coro_status_callbacks.clear()
         _LOGGER.debug("所有状态更新回调已清理")
 
     async def _batch_process_tasks(self, tasks, task_type="处理"):
@@ -794,6 +848,20 @@ class WindowControllerMQTTHandler:
                        task_type, i//batch_size + 1, success_count, len(batch_tasks))
         _LOGGER.info("所有批次%s完成，总成功: %d，总总数: %d", task_type, total_success, len(tasks))
     
+    def _publish_bind_response(self, msg_id):
+        """发送网关绑定(001)响应到gateway/<sn>/req主题，只拼接变化的id"""
+        # 网关的id通常为整数，其他类型按JSON编码以保持与完整序列化一致
+        encoded_id = str(msg_id).encode() if type(msg_id) is int else json.dumps(msg_id).encode()
+        self.hass.async_create_task(
+            mqtt.async_publish(
+                self.hass,
+                self.TOPIC_GATEWAY_REQ,
+                self._bind_rsp_prefix + encoded_id + self._bind_rsp_suffix,
+                1,
+                False
+            )
+        )
+    
     async def _handle_ctype_001(self, payload, ctype, data):
         """处理协议类型001：绑定网关"""
         # 检查是否包含设备信息（vesion, model等字段）
@@ -802,33 +870,13 @@ class WindowControllerMQTTHandler:
             _LOGGER.debug("收到网关设备信息: %s, 版本: %s", 
                          self.gateway_sn, data.get("vesion"))
             
-            # 构建响应消息 - 按照协议要求回复001
-            response_payload = {
-                "head": PROTOCOL_HEAD,
-                "ctype": "001",
-                "id": payload.get("id", 0),
-                "sn": self.gateway_sn,
-                "data": {
-                    "errcode": 0,
-                    "uuid": "4bc297c6-308d-4397-b1d6-2ef6ccc329d3"
-                }
-            }
-            
-            # 发送响应到网关 - 按照协议要求发送到gateway/<sn>/req主题
-            self.hass.create_task(
-                mqtt.async_publish(
-                    self.hass,
-                    self.TOPIC_GATEWAY_REQ,
-                    json.dumps(response_payload),
-                    1,
-                    False
-                )
-            )
+            # 按照协议要求回复001
+            self._publish_bind_response(payload.get("id", 0))
             _LOGGER.info("发送网关设备信息响应成功到主题: %s", self.TOPIC_GATEWAY_REQ)
             
             # 更新网关状态为在线
-            self.hass.create_task(
-                self.device_manager.update_gateway_status("online")
+            self.hass.async_create_task(
+                self.device_manager.update_gateway_status(GATEWAY_STATUS_ONLINE)
             )
             self.connected = True
             self._notify_status_change()
@@ -836,33 +884,13 @@ class WindowControllerMQTTHandler:
             # 网关主动发起绑定请求，需要发送响应
             _LOGGER.info("收到网关绑定请求: %s", self.gateway_sn)
             
-            # 构建响应消息 - 按照协议要求回复001
-            response_payload = {
-                "head": PROTOCOL_HEAD,
-                "ctype": "001",
-                "id": payload.get("id", 0),
-                "sn": self.gateway_sn,
-                "data": {
-                    "errcode": 0,
-                    "uuid": "4bc297c6-308d-4397-b1d6-2ef6ccc329d3"
-                }
-            }
-            
-            # 发送响应到网关 - 按照协议要求发送到gateway/<sn>/req主题
-            self.hass.create_task(
-                mqtt.async_publish(
-                    self.hass,
-                    self.TOPIC_GATEWAY_REQ,
-                    json.dumps(response_payload),
-                    1,
-                    False
-                )
-            )
+            # 按照协议要求回复001
+            self._publish_bind_response(payload.get("id", 0))
             _LOGGER.info("发送网关绑定响应成功到主题: %s", self.TOPIC_GATEWAY_REQ)
             
             # 更新网关状态
-            self.hass.create_task(
-                self.device_manager.update_gateway_status("online")
+            self.hass.async_create_task(
+                self.device_manager.update_gateway_status(GATEWAY_STATUS_ONLINE)
             )
             self.connected = True
             self._notify_status_change()
@@ -871,8 +899,8 @@ class WindowControllerMQTTHandler:
             errcode = data.get("errcode", -1)
             if errcode == 0:
                 _LOGGER.info("网关绑定成功: %s", self.gateway_sn)
-                self.hass.create_task(
-                    self.device_manager.update_gateway_status("online")
+                self.hass.async_create_task(
+                    self.device_manager.update_gateway_status(GATEWAY_STATUS_ONLINE)
                 )
                 self.connected = True
                 self._notify_status_change()
@@ -885,9 +913,10 @@ class WindowControllerMQTTHandler:
         """处理协议类型002：网关状态上报 - 优化版"""
         try:
             status = data.get("status", "unknown")
-            _LOGGER.debug("网关状态上报: %s", status)
+            if _LOGGER.isEnabledFor(logging.DEBUG):
+                _LOGGER.debug("网关状态上报: %s", status)
             # 使用async_create_task包装异步操作
-            self.hass.create_task(
+            self.hass.async_create_task(
                 self.device_manager.update_gateway_status(status)
             )
             self.connected = True  # 收到上报就认为在线
@@ -897,7 +926,7 @@ class WindowControllerMQTTHandler:
             try:
                 from .discovery import async_discover_gateway
                 gateway_name = f"慧尖网关 {self.gateway_sn[-4:]}"
-                self.hass.create_task(
+                self.hass.async_create_task(
                     async_discover_gateway(self.hass, self.gateway_sn, gateway_name)
                 )
                 _LOGGER.debug("触发网关发现，确保忽略按钮显示")
@@ -911,8 +940,8 @@ class WindowControllerMQTTHandler:
                 # 使用集合记录已处理的设备，避免重复处理
                 processed_sns = set()
                 
-                # 批量添加和更新任务
-                add_tasks = []
+                # 待添加的新设备和更新任务
+                new_devices = []
                 update_tasks = []
                 
                 for device_info in devices:
@@ -949,15 +978,23 @@ class WindowControllerMQTTHandler:
                                 _LOGGER.info("设备 %s 已被手动删除，不自动重新添加", device_sn)
                                 continue
                             
-                            # 快速添加设备任务
-                            add_tasks.append(self._quick_add_device(device_sn, device_info))
+                            # 收集新设备，稍后批量添加
+                            new_devices.append((device_sn, device_info))
                             
                     except Exception as e:
                         _LOGGER.error("处理设备信息异常: %s", e, exc_info=True)
                 
-                # 分批执行添加任务，每批10个设备
-                if add_tasks:
-                    await self._batch_process_tasks(add_tasks, "添加设备")
+                # 批量添加新设备，再分批更新它们的状态
+                if new_devices:
+                    # 使用网关SN和子设备SN后4位生成设备名称，与setup方法保持一致
+                    await self.device_manager.add_devices_bulk([
+                        (device_sn, f"开窗器 {self.gateway_sn[-4:]}-{device_sn[-4:]}")
+                        for device_sn, _ in new_devices
+                    ])
+                    await self._batch_process_tasks(
+                        [self._update_device_attributes(device_sn, device_info) for device_sn, device_info in new_devices],
+                        "添加设备"
+                    )
                 
                 # 分批执行更新任务，每批10个设备
                 if update_tasks:
@@ -982,28 +1019,17 @@ class WindowControllerMQTTHandler:
         
         # 发送响应到网关 - 按照协议要求发送到gateway/<sn>/req主题
         from homeassistant.components import mqtt
-        self.hass.create_task(
+        self.hass.async_create_task(
             mqtt.async_publish(
                 self.hass,
                 self.TOPIC_GATEWAY_REQ,
-                json.dumps(response_payload),
+                _json_dumps(response_payload),
                 1,
                 False
             )
         )
         _LOGGER.info("发送网关状态上报响应成功到主题: %s", self.TOPIC_GATEWAY_REQ)
 
-    async def _quick_add_device(self, device_sn, device_info):
-        """快速添加设备"""
-        # 使用网关SN和子设备SN后4位生成设备名称，与setup方法保持一致
-        device_name = f"开窗器 {self.gateway_sn[-4:]}-{device_sn[-4:]}"
-        
-        # 直接调用设备管理器的添加方法
-        await self.device_manager.add_device(device_sn, device_name, DEVICE_TYPE_WINDOW_OPENER)
-        
-        # 立即更新设备状态
-        await self._update_device_attributes(device_sn, device_info)
-
     async def _update_existing_device(self, device_sn, device_info):
         """更新已有设备状态"""
         attributes = {}
@@ -1032,6 +1058,7 @@ class WindowControllerMQTTHandler:
     
     async def _update_device_attributes(self, device_sn, device_info):
         """更新设备属性"""
+        debug = _LOGGER.isEnabledFor(logging.DEBUG)
         attributes = {}
         
         # 提取设备属性
@@ -1039,7 +1066,8 @@ class WindowControllerMQTTHandler:
             try:
                 voltage = float(device_info["battery"]) / 10
                 attributes["voltage"] = voltage
-                _LOGGER.debug("设备 %s 电池电压: %.1fV", device_sn, voltage)
+                if debug:
+                    _LOGGER.debug("设备 %s 电池电压: %.1fV", device_sn, voltage)
             except ValueError as e:
                 _LOGGER.error("电池电压数据格式错误: %s, 值: %s", e, device_info["battery"])
         
@@ -1047,7 +1075,8 @@ class WindowControllerMQTTHandler:
             try:
                 r_travel = int(device_info["r_travel"])
                 attributes["r_travel"] = r_travel
-                _LOGGER.debug("设备 %s 位置状态: %d", device_sn, r_travel)
+                if debug:
+                    _LOGGER.debug("设备 %s 位置状态: %d", device_sn, r_travel)
             except ValueError as e:
                 _LOGGER.error("位置状态数据格式错误: %s, 值: %s", e, device_info["r_travel"])
         
@@ -1078,7 +1107,7 @@ class WindowControllerMQTTHandler:
             device_count = len(self.device_manager.get_all_devices())
             device_number = device_count + 1
             device_name = f"开窗器 {device_number:02d}"
-            self.hass.create_task(
+            self.hass.async_create_task(
                 self.device_manager.add_device(device_sn, device_name, DEVICE_TYPE_WINDOW_OPENER, force=True)
             )
             _LOGGER.info("设备绑定成功: %s, 名称: %s", device_sn, device_name)
@@ -1114,22 +1143,20 @@ class WindowControllerMQTTHandler:
         """处理协议类型005：设备上报"""
         device_sn = data.get("sn")
         if device_sn:
+            debug = _LOGGER.isEnabledFor(logging.DEBUG)
             # 解析设备上报的状态
             status = data.get("status", "unknown")
-            attributes = {}
             
-            # 提取上报的属性
-            if "position" in data:
-                attributes[ATTR_POSITION] = data["position"]
-            if "battery" in data:
+            # 提取直接透传的属性
+            attributes = {attr: data[key] for key, attr in _REPORT_ATTRS if key in data}
+            battery = data.get("battery")
+            if battery is not None:
                 # 统一存储为 voltage，与网关上报保持一致
-                battery = data["battery"]
                 # 转换为浮点数并除以10（如105 → 10.5V）
                 voltage = float(battery) / 10
                 attributes["voltage"] = voltage
-                _LOGGER.debug("设备 %s 电池电压: %.1fV", device_sn, voltage)
-            if "state" in data:
-                attributes["state"] = data["state"]
+                if debug:
+                    _LOGGER.debug("设备 %s 电池电压: %.1fV", device_sn, voltage)
             
             # 处理attrs数组
             if "attrs" in data:
@@ -1152,13 +1179,47 @@ class WindowControllerMQTTHandler:
                         else:
                             status = "open"
             
-            # 更新设备状态
-            self.hass.create_task(
-                self.device_manager.update_device_status(device_sn, status, attributes)
+            # 放入合并窗口，窗口结束后统一更新设备状态
+            self._queue_device_update(device_sn, status, attributes)
+            if debug:
+                _LOGGER.debug("设备上报处理完成: %s", device_sn)
+    
+    def _queue_device_update(self, device_sn, status, attributes):
+        """将设备上报放入合并窗口，同一设备的多次上报合并为一次状态更新"""
+        pending = self._pending_updates.get(device_sn)
+        if pending is not None:
+            # 后到的属性覆盖先到的，未出现的属性保留
+            pending[1].update(attributes)
+            attributes = pending[1]
+        self._pending_updates[device_sn] = (status, attributes)
+        if self._flush_handle is None:
+            self._flush_handle = self.hass.loop.call_later(
+                STATUS_COALESCE_INTERVAL, self._flush_updates
             )
+    
+    def _flush_updates(self):
+        """合并窗口结束，取出所有待应用的设备上报"""
+        self._flush_handle = None
+        pending, self._pending_updates = self._pending_updates, {}
+        if pending:
+            self.hass.async_create_task(self._apply_pending_updates(pending))
+    
+    async def _apply_pending_updates(self, pending):
+        """并发应用合并后的设备上报，并通知传感器实体更新"""
+        device_sns = list(pending)
+        results = await asyncio.gather(
+            *(
+                self.device_manager.update_device_status(device_sn, status, attributes)
+                for device_sn, (status, attributes) in pending.items()
+            ),
+            return_exceptions=True
+        )
+        for device_sn, result in zip(device_sns, results):
+            if isinstance(result, Exception):
+                _LOGGER.error("更新设备 %s 状态失败: %s", device_sn, result)
+                continue
             # 通知设备状态变化，触发传感器实体更新
             self._notify_device_status_change(device_sn)
-            _LOGGER.debug("设备上报处理完成: %s", device_sn)
 
     async def _handle_ctype_006(self, payload, ctype, data):
         """处理协议类型006：批量设备状态上报"""
@@ -1,20 +1,28 @@
 """开窗器网关传感器平台"""
 import logging
-from typing import Optional
+import weakref
+from dataclasses import dataclass
+from functools import cached_property
+from typing import Callable, List, Optional
 
-from homeassistant.core import HomeAssistant
+from homeassistant.core import HomeAssistant, callback
 from homeassistant.config_entries import ConfigEntry
 from homeassistant.components.sensor import SensorEntity, SensorDeviceClass
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
 from homeassistant.helpers.entity import DeviceInfo
+from homeassistant.helpers.dispatcher import async_dispatcher_connect
+from homeassistant.helpers.entity_registry import async_get as async_get_entity_registry
 
-from datetime import timedelta
+from datetime import datetime, timedelta
 
 from .const import (
     DOMAIN,
     CONF_GATEWAY_SN,
     CONF_GATEWAY_NAME,
-    DEFAULT_GATEWAY_NAME
+    DEFAULT_GATEWAY_NAME,
+    DEVICE_TO_GATEWAY_MAPPING,
+    MANUFACTURER,
+    SIGNAL_GATEWAY_REASSIGN
 )
 from .base_entity import WindowControllerBaseEntity
 from .utils import get_device_gateway_mapping
@@ -23,14 +31,76 @@ from .const import SENSOR_SCAN_INTERVAL
 # 传感器扫描间隔，设置为10秒以提高更新频率
 SCAN_INTERVAL = timedelta(seconds=SENSOR_SCAN_INTERVAL)
 
+# 超过该时长设备数据中没有可用数值则清空传感器状态
+DATA_TIMEOUT = timedelta(minutes=15)
+
 _LOGGER = logging.getLogger(__name__)
 
-from .utils import get_entity_registry
 
-# 直接使用从utils导入的get_entity_registry函数，不再重复定义
+@dataclass(slots=True)
+class _SensorPair:
+    """单个设备创建的电池电压/状态传感器unique_id
+
+    只保存unique_id而不持有实体对象，避免已移除的实体因被引用而无法释放
+    """
+    battery: Optional[str] = None
+    status: Optional[str] = None
+    # 该设备合并后的状态更新回调，由此处持有强引用（MQTT处理器只保存弱引用）
+    update_callback: Optional[Callable] = None
+
+
+def _make_device_update_callback(entities: List[SensorEntity]) -> Callable:
+    """为同一设备的多个传感器创建合并的状态更新回调
+
+    每条MQTT消息只调度一次回调，在一次执行中依次更新该设备的全部传感器；
+    回调内部只持有实体的弱引用，不延长实体生命周期
+    """
+    entity_refs = [weakref.ref(entity) for entity in entities]
+
+    async def _update_all():
+        for entity_ref in entity_refs:
+            entity = entity_ref()
+            if entity is not None:
+                await entity.async_update()
+
+    return _update_all
+
+
+class _RevisionGuardMixin:
+    """按设备数据修订号跳过重复解析的传感器混入类
 
+    子类实现 _parse_device_value，并在初始化时设置 last_update_time、
+    _last_rev 和 _rev_value
+    """
 
-class WindowControllerBatterySensor(WindowControllerBaseEntity, SensorEntity):
+    def _parse_device_value(self, device):
+        """从设备数据中解析传感器数值，没有可用数值时返回None"""
+        raise NotImplementedError
+
+    def _update_state(self):
+        """从设备管理器更新状态"""
+        device = self.device_manager.get_device(self.device_sn)
+        if device:
+            # 设备数据修订号未变化时沿用上次解析的数值，跳过重新解析
+            rev = device.get("_rev", 0)
+            if rev != self._last_rev:
+                self._last_rev = rev
+                self._rev_value = self._parse_device_value(device)
+            if self._rev_value is not None:
+                self._attr_native_value = self._rev_value
+                self.last_update_time = datetime.now()
+        
+        # 检查是否超过15分钟没有更新
+        if self.last_update_time and (datetime.now() - self.last_update_time) > DATA_TIMEOUT:
+            self._attr_native_value = None
+            _LOGGER.debug("设备 %s 的 %s 数据超时", self.device_sn, self._attr_name)
+
+    async def async_update(self):
+        """更新实体状态"""
+        self._update_state()
+
+
+class WindowControllerBatterySensor(_RevisionGuardMixin, WindowControllerBaseEntity, SensorEntity):
     """开窗器电池电压传感器"""
     
     def __init__(
@@ -59,6 +129,8 @@ class WindowControllerBatterySensor(WindowControllerBaseEntity, SensorEntity):
         self._attr_device_class = SensorDeviceClass.VOLTAGE
         self._attr_state_class = "measurement"
         self.last_update_time = None  # 最后更新时间
+        self._last_rev = None  # 最后处理的设备数据修订号
+        self._rev_value = None  # 该修订号解析出的数值
         self.entry_id = entry_id
         # 添加图标
         self._attr_icon = "mdi:battery"
@@ -71,10 +143,9 @@ class WindowControllerBatterySensor(WindowControllerBaseEntity, SensorEntity):
         # 由于初始化时可能还未设置，这里暂时不注册
         # 回调注册将在async_add_entities后通过其他方式处理
     
-    @property
+    @cached_property
     def device_info(self) -> DeviceInfo:
-        """返回设备信息"""
-        from .const import MANUFACTURER
+        """返回设备信息（缓存，网关映射变更时失效）"""
         # 使用基类方法获取当前关联的网关
         current_gateway_sn = self.get_current_gateway_sn()
         
@@ -86,35 +157,37 @@ class WindowControllerBatterySensor(WindowControllerBaseEntity, SensorEntity):
             via_device=(DOMAIN, current_gateway_sn)
         )
     
-    def _update_state(self):
-        """从设备管理器更新状态"""
-        from datetime import datetime, timedelta
-        
-        device = self.device_manager.get_device(self.device_sn)
-        if device:
-            attributes = device.get("attributes", {})
-            voltage = attributes.get("voltage")
-            if voltage is not None:
-                self._attr_native_value = voltage
-                self.last_update_time = datetime.now()
-                _LOGGER.debug("设备 %s 电池电压更新: %.1fV", self.device_sn, voltage)
-        
-        # 检查是否超过15分钟没有更新
-        if self.last_update_time and (datetime.now() - self.last_update_time) > timedelta(minutes=15):
-            self._attr_native_value = None
-            _LOGGER.debug("设备 %s 电池电压数据超时", self.device_sn)
+    async def async_added_to_hass(self) -> None:
+        """实体添加到Home Assistant时订阅网关映射变更信号"""
+        await super().async_added_to_hass()
+        self.async_on_remove(
+            async_dispatcher_connect(
+                self.hass,
+                SIGNAL_GATEWAY_REASSIGN.format(device_sn=self.device_sn),
+                self._on_gateway_reassigned
+            )
+        )
+    
+    @callback
+    def _on_gateway_reassigned(self) -> None:
+        """网关映射变更时清除缓存的设备信息（设备注册表由映射写入方更新）"""
+        self.__dict__.pop("device_info", None)
+    
+    def _parse_device_value(self, device):
+        """解析电池电压"""
+        voltage = device.get("attributes", {}).get("voltage")
+        if voltage is not None:
+            _LOGGER.debug("设备 %s 电池电压更新: %.1fV", self.device_sn, voltage)
+        return voltage
     
     @property
     def native_unit_of_measurement(self):
         """返回单位 - 确保即使状态为None时也返回正确的单位"""
         return "V"
     
-    async def async_update(self):
-        """更新实体状态"""
-        self._update_state()
 
 
-class WindowControllerStatusSensor(SensorEntity):
+class WindowControllerStatusSensor(_RevisionGuardMixin, SensorEntity):
     """开窗器状态传感器"""
     
     def __init__(
@@ -139,14 +212,15 @@ class WindowControllerStatusSensor(SensorEntity):
         self._attr_device_class = SensorDeviceClass.ENUM
         self._attr_options = ["closed", "open"]
         self.last_update_time = None  # 最后更新时间
+        self._last_rev = None  # 最后处理的设备数据修订号
+        self._rev_value = None  # 该修订号解析出的数值
         
         # 初始化状态
         self._update_state()
     
-    @property
+    @cached_property
     def device_info(self) -> DeviceInfo:
-        """返回设备信息"""
-        from .const import MANUFACTURER, DEVICE_TO_GATEWAY_MAPPING
+        """返回设备信息（缓存，网关映射变更时失效）"""
         # 动态获取设备当前关联的网关
         current_gateway_sn = self.gateway_sn
         if DEVICE_TO_GATEWAY_MAPPING in self.hass.data[DOMAIN]:
@@ -163,35 +237,37 @@ class WindowControllerStatusSensor(SensorEntity):
             via_device=(DOMAIN, current_gateway_sn)
         )
     
-    def _update_state(self):
-        """从设备管理器更新状态"""
-        from datetime import datetime, timedelta
-        
-        device = self.device_manager.get_device(self.device_sn)
-        if device:
-            # 优先使用设备状态
-            status = device.get("status")
-            if status in ["closed", "open"]:
-                self._attr_native_value = status
-                self.last_update_time = datetime.now()
-                _LOGGER.debug("设备 %s 状态更新为: %s", self.device_sn, status)
-            else:
-                # 如果没有状态，使用r_travel判断
-                attributes = device.get("attributes", {})
-                r_travel = attributes.get("r_travel")
-                if r_travel is not None:
-                    new_status = "closed" if r_travel == 0 else "open"
-                    self._attr_native_value = new_status
-                    self.last_update_time = datetime.now()
-                    _LOGGER.debug("设备 %s 状态根据r_travel更新为: %s", self.device_sn, new_status)
-        
-        # 检查是否超过15分钟没有更新
-        if self.last_update_time and (datetime.now() - self.last_update_time) > timedelta(minutes=15):
-            self._attr_native_value = None
+    async def async_added_to_hass(self) -> None:
+        """实体添加到Home Assistant时订阅网关映射变更信号"""
+        await super().async_added_to_hass()
+        self.async_on_remove(
+            async_dispatcher_connect(
+                self.hass,
+                SIGNAL_GATEWAY_REASSIGN.format(device_sn=self.device_sn),
+                self._on_gateway_reassigned
+            )
+        )
     
-    async def async_update(self):
-        """更新实体状态"""
-        self._update_state()
+    @callback
+    def _on_gateway_reassigned(self) -> None:
+        """网关映射变更时清除缓存的设备信息（设备注册表由映射写入方更新）"""
+        self.__dict__.pop("device_info", None)
+    
+    def _parse_device_value(self, device):
+        """解析开关状态"""
+        # 优先使用设备状态
+        status = device.get("status")
+        if status in ["closed", "open"]:
+            _LOGGER.debug("设备 %s 状态更新为: %s", self.device_sn, status)
+            return status
+        
+        # 如果没有状态，使用r_travel判断
+        r_travel = device.get("attributes", {}).get("r_travel")
+        if r_travel is not None:
+            new_status = "closed" if r_travel == 0 else "open"
+            _LOGGER.debug("设备 %s 状态根据r_travel更新为: %s", self.device_sn, new_status)
+            return new_status
+        return None
 
 
 async def async_setup_entry(
@@ -218,7 +294,7 @@ async def async_setup_entry(
     gateway_sn = entry.data[CONF_GATEWAY_SN]
     
     # 跟踪创建的传感器实体
-    created_sensors = {}
+    created_sensors: dict[str, _SensorPair] = {}
     
     # 定义设备添加回调函数
     async def on_device_added(device_sn: str, device_name: str, device_type: str):
@@ -226,11 +302,11 @@ async def async_setup_entry(
         _LOGGER.info("收到设备添加回调: %s - %s", device_name, device_sn)
         
         # 检查实体是否已经存在于实体注册表中
-        entity_registry = get_entity_registry(hass)
+        entity_registry = async_get_entity_registry(hass)
         
         # 存储要添加的实体
         entities_to_add = []
-        sensors_to_track = {}
+        sensors_to_track = _SensorPair()
         
         # 检查并创建电池电压传感器
         battery_sensor_unique_id = f"{device_sn}_battery"
@@ -244,7 +320,7 @@ async def async_setup_entry(
                 device_name
             )
             entities_to_add.append(battery_sensor)
-            sensors_to_track["battery"] = battery_sensor
+            sensors_to_track.battery = battery_sensor_unique_id
             _LOGGER.debug("为设备 %s 添加电池传感器", device_name)
         else:
             _LOGGER.debug("设备 %s 的电池传感器已存在，跳过创建", device_name)
@@ -261,7 +337,7 @@ async def async_setup_entry(
                 device_name
             )
             entities_to_add.append(status_sensor)
-            sensors_to_track["status"] = status_sensor
+            sensors_to_track.status = status_sensor_unique_id
             _LOGGER.debug("为设备 %s 添加状态传感器", device_name)
         else:
             _LOGGER.debug("设备 %s 的状态传感器已存在，跳过创建", device_name)
@@ -272,6 +348,7 @@ async def async_setup_entry(
             _LOGGER.info("为新设备 %s 添加了传感器实体", device_name)
             
             # 跟踪创建的传感器
+            sensors_to_track.update_callback = _make_device_update_callback(entities_to_add)
             created_sensors[device_sn] = sensors_to_track
             
             # 注册状态更新回调
@@ -281,12 +358,8 @@ async def async_setup_entry(
             if entry_data:
                 mqtt_handler = entry_data.get("mqtt_handler")
                 if mqtt_handler:
-                    # 为电池传感器注册回调
-                    if "battery" in sensors_to_track:
-                        mqtt_handler.add_status_callback(device_sn, sensors_to_track["battery"].async_update)
-                    # 为状态传感器注册回调
-                    if "status" in sensors_to_track:
-                        mqtt_handler.add_status_callback(device_sn, sensors_to_track["status"].async_update)
+                    # 电池传感器和状态传感器共用一个回调
+                    mqtt_handler.add_status_callback(device_sn, sensors_to_track.update_callback)
                     _LOGGER.debug("为设备 %s 注册了状态更新回调", device_sn)
 
     # 定义设备移除回调函数
@@ -307,33 +380,25 @@ async def async_setup_entry(
                 if entry_data:
                     mqtt_handler = entry_data.get("mqtt_handler")
                     if mqtt_handler:
-                        # 移除电池传感器回调
-                        if "battery" in sensors:
-                            battery_entity = sensors["battery"]
-                            mqtt_handler.remove_status_callback(device_sn, battery_entity.async_update)
-                        # 移除状态传感器回调
-                        if "status" in sensors:
-                            status_entity = sensors["status"]
-                            mqtt_handler.remove_status_callback(device_sn, status_entity.async_update)
+                        if sensors.update_callback is not None:
+                            mqtt_handler.remove_status_callback(device_sn, sensors.update_callback)
                         _LOGGER.debug("已移除设备 %s 的状态更新回调", device_sn)
             except Exception as e:
                 _LOGGER.error("移除设备 %s 的状态更新回调失败: %s", device_name, e)
             
             # 尝试从实体注册表中删除实体
             try:
-                entity_registry = get_entity_registry(hass)
+                entity_registry = async_get_entity_registry(hass)
                 # 删除电池传感器
-                if "battery" in sensors:
-                    battery_entity = sensors["battery"]
-                    if battery_entity.entity_id:
-                        entity_registry.async_remove(battery_entity.entity_id)
-                        _LOGGER.info("已从实体注册表中删除设备 %s 的电池传感器", device_name)
+                battery_entity_id = sensors.battery and entity_registry.async_get_entity_id("sensor", DOMAIN, sensors.battery)
+                if battery_entity_id:
+                    entity_registry.async_remove(battery_entity_id)
+                    _LOGGER.info("已从实体注册表中删除设备 %s 的电池传感器", device_name)
                 # 删除状态传感器
-                if "status" in sensors:
-                    status_entity = sensors["status"]
-                    if status_entity.entity_id:
-                        entity_registry.async_remove(status_entity.entity_id)
-                        _LOGGER.info("已从实体注册表中删除设备 %s 的状态传感器", device_name)
+                status_entity_id = sensors.status and entity_registry.async_get_entity_id("sensor", DOMAIN, sensors.status)
+                if status_entity_id:
+                    entity_registry.async_remove(status_entity_id)
+                    _LOGGER.info("已从实体注册表中删除设备 %s 的状态传感器", device_name)
             except Exception as e:
                 _LOGGER.error("从实体注册表中删除设备 %s 的传感器失败: %s", device_name, e)
 
@@ -348,55 +413,47 @@ async def async_setup_entry(
     devices = device_manager.get_all_devices()
     
     # 获取实体注册表，用于检查实体是否已存在
-    entity_registry = get_entity_registry(hass)
+    entity_registry = async_get_entity_registry(hass)
     
-    for device in devices:
-        device_sn = device.get("sn")
-        device_name = device.get("name")
-        
-        if device_sn and device_name:
-            # 检查并创建电池电压传感器
-            battery_sensor_unique_id = f"{device_sn}_battery"
-            existing_battery_entity_id = entity_registry.async_get_entity_id("sensor", DOMAIN, battery_sensor_unique_id)
-            if not existing_battery_entity_id:
-                battery_sensor = WindowControllerBatterySensor(
-                    hass,
-                    device_manager,
-                    gateway_sn,
-                    device_sn,
-                    device_name
-                )
-                entities.append(battery_sensor)
-                # 跟踪创建的传感器
-                if device_sn not in created_sensors:
-                    created_sensors[device_sn] = {}
-                created_sensors[device_sn]["battery"] = battery_sensor
-                _LOGGER.debug("为设备 %s 添加电池传感器", device_name)
-            else:
-                _LOGGER.debug("设备 %s 的电池传感器已存在于实体注册表中，跳过创建", device_name)
-            
-            # 检查并创建状态传感器
-            status_sensor_unique_id = f"{device_sn}_status"
-            existing_status_entity_id = entity_registry.async_get_entity_id("sensor", DOMAIN, status_sensor_unique_id)
-            if not existing_status_entity_id:
-                status_sensor = WindowControllerStatusSensor(
-                    hass,
-                    device_manager,
-                    gateway_sn,
-                    device_sn,
-                    device_name
-                )
-                entities.append(status_sensor)
-                # 跟踪创建的传感器
-                if device_sn not in created_sensors:
-                    created_sensors[device_sn] = {}
-                created_sensors[device_sn]["status"] = status_sensor
-                _LOGGER.debug("为设备 %s 添加状态传感器", device_name)
-            else:
-                _LOGGER.debug("设备 %s 的状态传感器已存在于实体注册表中，跳过创建", device_name)
-            
-            if device_sn in created_sensors:
-                _LOGGER.info("为设备 %s 添加传感器实体", device_name)
+    # 按unique_id逐个查询注册表索引，开销只与本网关的设备数相关
+    def _is_registered(unique_id: str) -> bool:
+        return entity_registry.async_get_entity_id("sensor", DOMAIN, unique_id) is not None
+    
+    named_devices = [device for device in devices if device.get("sn") and device.get("name")]
+    missing_battery = [device for device in named_devices if not _is_registered(f"{device['sn']}_battery")]
+    missing_status = [device for device in named_devices if not _is_registered(f"{device['sn']}_status")]
+    
+    # 创建缺失的电池电压传感器
+    for device in missing_battery:
+        device_sn = device["sn"]
+        device_name = device["name"]
+        battery_sensor = WindowControllerBatterySensor(
+            hass,
+            device_manager,
+            gateway_sn,
+            device_sn,
+            device_name
+        )
+        entities.append(battery_sensor)
+        # 跟踪创建的传感器
+        created_sensors.setdefault(device_sn, _SensorPair()).battery = battery_sensor.unique_id
+        _LOGGER.debug("为设备 %s 添加电池传感器", device_name)
+    
+    # 创建缺失的状态传感器
+    for device in missing_status:
+        device_sn = device["sn"]
+        device_name = device["name"]
+        status_sensor = WindowControllerStatusSensor(
+            hass,
+            device_manager,
+            gateway_sn,
+            device_sn,
+            device_name
+        )
+        entities.append(status_sensor)
+        # 跟踪创建的传感器
+        created_sensors.setdefault(device_sn, _SensorPair()).status = status_sensor.unique_id
+        _LOGGER.debug("为设备 %s 添加状态传感器", device_name)
     
     if entities:
         async_add_entities(entities)
@@ -408,16 +465,15 @@ async def async_setup_entry(
         if entry_data:
             mqtt_handler = entry_data.get("mqtt_handler")
             if mqtt_handler:
-                # 为每个已创建的传感器注册状态更新回调
-                # 遍历已创建的传感器，为每个设备的传感器注册回调
-                for device_sn, sensors in created_sensors.items():
-                    if "battery" in sensors:
-                        battery_sensor = sensors["battery"]
-                        mqtt_handler.add_status_callback(device_sn, battery_sensor.async_update)
-                        _LOGGER.debug("为设备 %s 的电池传感器注册了状态更新回调", device_sn)
-                    if "status" in sensors:
-                        status_sensor = sensors["status"]
-                        mqtt_handler.add_status_callback(device_sn, status_sensor.async_update)
-                        _LOGGER.debug("为设备 %s 的状态传感器注册了状态更新回调", device_sn)
+                # 按设备合并传感器，每个设备只注册一个状态更新回调
+                entities_by_device = {}
+                for entity in entities:
+                    entities_by_device.setdefault(entity.device_sn, []).append(entity)
+                for device_sn, device_entities in entities_by_device.items():
+                    created_sensors[device_sn].update_callback = _make_device_update_callback(device_entities)
+                mqtt_handler.add_status_callbacks(
+                    (device_sn, created_sensors[device_sn].update_callback)
+                    for device_sn in entities_by_device
+                )
     else:
         _LOGGER.info("当前没有设备，等待设备添加")
@@ -1,94 +1,118 @@
 """工具模块 - 存放通用辅助函数"""
 import logging
-from typing import Dict, Any, Optional, Tuple
+from typing import Dict, Any, FrozenSet, Optional, Tuple
 from homeassistant.core import HomeAssistant
+from homeassistant.helpers.dispatcher import async_dispatcher_send
+from homeassistant.helpers.device_registry import async_get as async_get_device_registry
 
-from .const import DOMAIN
+from .const import DOMAIN, DEVICE_TO_GATEWAY_MAPPING, SIGNAL_GATEWAY_REASSIGN
 
 _LOGGER = logging.getLogger(__name__)
 
 
-class EntityRegistryCacheManager:
-    """实体注册表缓存管理器"""
-    
-    # 类属性，存储单例实例
-    _instance = None
-    
-    def __new__(cls):
-        """单例模式"""
-        if cls._instance is None:
-            cls._instance = super(EntityRegistryCacheManager, cls).__new__(cls)
-            # 初始化实例属性
-            cls._instance._cache = {}
-            import threading
-            cls._instance._lock = threading.RLock()
-        return cls._instance
+# 设备SN反向索引在hass.data中的顶层键，值为 {设备SN: 配置条目ID}；
+# 不放在hass.data[DOMAIN]中，避免被当作配置条目数据遍历
+_SN_INDEX_KEY = f"{DOMAIN}_sn_index"
+
+# 已配置网关SN集合在hass.data中的顶层键，值为frozenset，只在配置条目加载/卸载时替换；
+# 同时缓存编码后的字节形式，供MQTT处理器在解析JSON前粗筛消息
+_GATEWAY_SNS_KEY = f"{DOMAIN}_gateway_sns"
+_GATEWAY_SN_BYTES_KEY = f"{DOMAIN}_gateway_sn_bytes"
+
+
+def get_configured_gateway_sns(hass: HomeAssistant) -> FrozenSet[str]:
+    """返回本集成已配置的网关SN集合"""
+    return hass.data.get(_GATEWAY_SNS_KEY, frozenset())
+
+
+def get_configured_gateway_sn_bytes(hass: HomeAssistant) -> FrozenSet[bytes]:
+    """返回本集成已配置的网关SN集合（字节形式）"""
+    return hass.data.get(_GATEWAY_SN_BYTES_KEY, frozenset())
+
+
+def _set_configured_gateway_sns(hass: HomeAssistant, gateway_sns: FrozenSet[str]) -> None:
+    """替换已配置网关SN集合及其字节形式缓存"""
+    hass.data[_GATEWAY_SNS_KEY] = gateway_sns
+    hass.data[_GATEWAY_SN_BYTES_KEY] = frozenset(sn.encode() for sn in gateway_sns)
+
+
+def register_gateway_sn(hass: HomeAssistant, gateway_sn: str) -> None:
+    """配置条目加载时登记网关SN
     
-    def get_entity_registry(self, hass: HomeAssistant):
-        """获取实体注册表（带缓存）
-        
-        Args:
-            hass: Home Assistant实例
-        
-        Returns:
-            EntityRegistry: 实体注册表
-        """
-        with self._lock:
-            if hass not in self._cache:
-                from homeassistant.helpers.entity_registry import async_get as async_get_entity_registry
-                self._cache[hass] = async_get_entity_registry(hass)
-            return self._cache[hass]
-    
-    def clear_cache(self, hass: HomeAssistant = None):
-        """清理缓存
-        
-        Args:
-            hass: Home Assistant实例，如果为None则清理所有缓存
-        """
-        with self._lock:
-            if hass is None:
-                self._cache.clear()
-                _LOGGER.debug("所有实体注册表缓存已清理")
-            elif hass in self._cache:
-                del self._cache[hass]
-                _LOGGER.debug("实体注册表缓存已清理")
-    
-    def has_cache(self, hass: HomeAssistant) -> bool:
-        """检查是否有缓存
-        
-        Args:
-            hass: Home Assistant实例
-        
-        Returns:
-            bool: 是否有缓存
-        """
-        with self._lock:
-            return hass in self._cache
+    Args:
+        hass: Home Assistant实例
+        gateway_sn: 网关SN
+    """
+    _set_configured_gateway_sns(hass, get_configured_gateway_sns(hass) | {gateway_sn})
 
 
-# 创建全局实例
-entity_registry_cache_manager = EntityRegistryCacheManager()
+def unregister_gateway_sn(hass: HomeAssistant, gateway_sn: str) -> None:
+    """配置条目卸载时移除网关SN
+    
+    Args:
+        hass: Home Assistant实例
+        gateway_sn: 网关SN
+    """
+    _set_configured_gateway_sns(hass, get_configured_gateway_sns(hass) - {gateway_sn})
 
 
-def get_entity_registry(hass: HomeAssistant):
-    """获取实体注册表（带缓存）
+def index_device_sn(hass: HomeAssistant, device_sn: str, entry_id: str) -> None:
+    """将设备SN加入反向索引
     
     Args:
         hass: Home Assistant实例
+        device_sn: 设备SN
+        entry_id: 设备所属网关的配置条目ID
+    """
+    hass.data.setdefault(_SN_INDEX_KEY, {})[device_sn] = entry_id
+
+
+def unindex_device_sn(hass: HomeAssistant, device_sn: str, entry_id: str) -> None:
+    """从反向索引中移除设备SN（仅当其仍指向该配置条目时）
     
-    Returns:
-        EntityRegistry: 实体注册表
+    Args:
+        hass: Home Assistant实例
+        device_sn: 设备SN
+        entry_id: 设备所属网关的配置条目ID
     """
-    return entity_registry_cache_manager.get_entity_registry(hass)
+    sn_index = hass.data.get(_SN_INDEX_KEY)
+    if sn_index and sn_index.get(device_sn) == entry_id:
+        del sn_index[device_sn]
 
 
-def clear_entity_registry_cache(hass: HomeAssistant = None):
-    """清理实体注册表缓存
+def clear_device_sn_index(hass: HomeAssistant, entry_id: str) -> None:
+    """移除反向索引中属于指定配置条目的所有设备SN
     
     Args:
-        hass: Home Assistant实例，如果为None则清理所有缓存
+        hass: Home Assistant实例
+        entry_id: 配置条目ID
     """
-    entity_registry_cache_manager.clear_cache(hass)
+    sn_index = hass.data.get(_SN_INDEX_KEY)
+    if sn_index:
+        for device_sn in [sn for sn, eid in sn_index.items() if eid == entry_id]:
+            del sn_index[device_sn]
+
+
+def _lookup_device_sn_index(hass: Any, device_id: str) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
+    """通过反向索引查找设备ID对应的设备SN和网关数据
+    
+    设备ID的最后一段（以"-"分隔）作为设备SN进行查找
+    
+    Returns:
+        Tuple[Optional[str], Optional[Dict[str, Any]]]: (设备SN, 网关数据)，未命中时返回 (None, None)
+    """
+    sn_index = hass.data.get(_SN_INDEX_KEY)
+    if not sn_index:
+        return None, None
+    device_sn = device_id.rsplit("-", 1)[-1]
+    entry_id = sn_index.get(device_sn)
+    if entry_id is None:
+        return None, None
+    data = hass.data[DOMAIN].get(entry_id)
+    if not isinstance(data, dict):
+        return None, None
+    return device_sn, data
+
 
 def find_gateway_by_device_id(hass: Any, device_id: str) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
     """根据设备ID查找对应的网关
@@ -104,18 +128,28 @@ def find_gateway_by_device_id(hass: Any, device_id: str) -> Tuple[Optional[Dict[
         _LOGGER.error("服务调用失败：集成尚未完成初始化或没有已配置的网关。")
         return None, None
 
+    # 优先按网关SN匹配
     for entry_id, data in hass.data[DOMAIN].items():
         if isinstance(data, dict):
             gateway_sn = data.get("gateway_sn", "")
             if gateway_sn in device_id:
                 return data, gateway_sn
-            
+
+    # 再使用设备SN反向索引，未命中时回退到遍历
+    device_sn, data = _lookup_device_sn_index(hass, device_id)
+    if data is not None:
+        return data, data.get("gateway_sn", "")
+
+    for entry_id, data in hass.data[DOMAIN].items():
+        if isinstance(data, dict):
+            gateway_sn = data.get("gateway_sn", "")
             # 检查是否包含设备SN
             device_manager = data.get("device_manager")
             if device_manager:
                 devices = device_manager.get_all_devices()
                 for device in devices:
-                    if device.get("sn") in device_id:
+                    sn = device.get("sn")
+                    if sn and device_id.endswith(sn):
                         return data, gateway_sn
     
     return None, None
@@ -134,14 +168,25 @@ def find_device_by_device_id(hass: Any, device_id: str) -> Tuple[Optional[Dict[s
         _LOGGER.error("服务调用失败：集成尚未完成初始化或没有已配置的网关。")
         return None, None, None
 
+    # 优先使用反向索引，未命中时回退到遍历
+    device_sn, data = _lookup_device_sn_index(hass, device_id)
+    if data is not None:
+        device_manager = data.get("device_manager")
+        device = device_manager.get_device(device_sn) if device_manager else None
+        if device:
+            device = device.copy()
+            device.setdefault("sn", device_sn)
+            return device, data, data.get("gateway_sn", "")
+
     for entry_id, data in hass.data[DOMAIN].items():
         if isinstance(data, dict):
             device_manager = data.get("device_manager")
             if device_manager:
                 devices = device_manager.get_all_devices()
                 for device in devices:
-                    if device.get("sn") in device_id:
-                        return device, data, data.get("gateway_sn", "")
+                    sn = device.get("sn")
+                    if sn and device_id.endswith(sn):
+                        return device.copy(), data, data.get("gateway_sn", "")
 
     return None, None, None
 
@@ -157,11 +202,37 @@ def get_device_gateway_mapping(hass: HomeAssistant, device_sn: str) -> Optional[
         Optional[str]: 网关SN，如果未找到返回None
     """
     try:
-        from .const import DEVICE_TO_GATEWAY_MAPPING
         if DOMAIN in hass.data and DEVICE_TO_GATEWAY_MAPPING in hass.data[DOMAIN]:
             device_to_gateway_mapping = hass.data[DOMAIN][DEVICE_TO_GATEWAY_MAPPING]
             if device_sn in device_to_gateway_mapping:
                 return device_to_gateway_mapping[device_sn]
     except Exception as e:
         _LOGGER.error("获取设备网关映射失败: %s", e)
-    return None
\ No newline at end of file
+    return None
+
+
+def set_device_gateway_mapping(hass: HomeAssistant, device_sn: str, gateway_sn: str) -> None:
+    """更新设备关联的网关SN
+    
+    映射发生变化时同步设备注册表中设备的上级网关（via_device_id），
+    并发送 SIGNAL_GATEWAY_REASSIGN 信号，让缓存了 device_info 的实体失效。
+    
+    Args:
+        hass: Home Assistant实例
+        device_sn: 设备SN
+        gateway_sn: 网关SN
+    """
+    device_to_gateway_mapping = hass.data.setdefault(DOMAIN, {}).setdefault(DEVICE_TO_GATEWAY_MAPPING, {})
+    if device_to_gateway_mapping.get(device_sn) == gateway_sn:
+        return
+    device_to_gateway_mapping[device_sn] = gateway_sn
+    
+    # device_info只在实体添加时被读取，网关变更需直接更新设备注册表
+    device_registry = async_get_device_registry(hass)
+    device = device_registry.async_get_device(identifiers={(DOMAIN, device_sn)})
+    gateway_device = device_registry.async_get_device(identifiers={(DOMAIN, gateway_sn)})
+    if device and gateway_device and device.via_device_id != gateway_device.id:
+        device_registry.async_update_device(device.id, via_device_id=gateway_device.id)
+        _LOGGER.debug("设备 %s 的上级网关已更新为: %s", device_sn, gateway_sn)
+    
+    async_dispatcher_send(hass, SIGNAL_GATEWAY_REASSIGN.format(device_sn=device_sn))
@@ -1,18 +1,22 @@
 # 简单的语法检查脚本
+import glob
+import sys
 
-files = [
-    'custom_components/window_controller_gateway/device_manager.py',
-    'custom_components/window_controller_gateway/mqtt_handler.py',
-    'custom_components/window_controller_gateway/sensor.py'
-]
+# 检查整个集成目录下的所有Python文件，只在内存中编译，不写入.pyc文件
+files = sorted(glob.glob('custom_components/window_controller_gateway/*.py'))
 
+ok = True
 for file in files:
     try:
-        with open(file, 'r') as f:
+        with open(file, 'r', encoding='utf-8') as f:
             code = f.read()
         compile(code, file, 'exec')
-        print(f"{file}: 语法正确")
     except SyntaxError as e:
+        ok = False
         print(f"{file}: 语法错误 - 行 {e.lineno}, 列 {e.offset}: {e.msg}")
     except Exception as e:
+        ok = False
         print(f"{file}: 错误 - {e}")
+
+print("语法正确" if ok else "存在语法错误")
+sys.exit(0 if ok else 1)